@@ -1,4 +1,14 @@
+import collections
 import datetime
+import logging
+import re
+
+from app.item_price_columns import ItemPriceColumns
+
+INPUT_DELIMITER = '|'
+HEADER_PREFIX = 'A' + INPUT_DELIMITER
+HEADER_EVENT_FIELD = 4
+
 
 class Adjustment(object):
     DATA_TYPES = {
@@ -15,7 +25,22 @@ class Adjustment(object):
         "I": "add_item_price"
     }
 
-    def __init__(self, data=None, logger=None):
+    """ number of fields after the data type for every line type """
+    FIELD_COUNTS = {
+        "A": 5,
+        "D": 3,
+        "S": 11,
+        "U": 4,
+        "C": 5,
+        "L": 5,
+        "P": 6,
+        "V": 3,
+        "CB": 1,
+        "LB": 3,
+        "I": 16
+    }
+
+    def __init__(self, data=None, logger=None, item_fields=None, item_columns=False):
 
         self.oid = None
         self.external_id = None
@@ -36,23 +61,69 @@ class Adjustment(object):
         self.location_business = {}
         self.customer_business = []
         self.item_price = []
+        self.line_counts = collections.defaultdict(int)
         self.logger = logger
 
-        self.process_file(data)
+        """ projection: only these ItemPrice fields are kept, all of them when it is None """
+        self.item_fields = item_fields
+        self._item_projection = None
+
+        """ columnar mode: style codes and prices of item price lines are kept in columns, item_price is empty """
+        self.item_columns = ItemPriceColumns() if item_columns else None
+
+        self._handlers = self.bind_handlers()
+
+        if data is not None:
+            self.process_file(data)
+
+    def __getstate__(self):
+        """bound handlers, projection slots and logger are not picklable, logger is restored by name"""
+        state = self.__dict__.copy()
+        del state['_handlers']
+        state.pop('_item_projection', None)
+        logger = state.pop('logger')
+        state['logger_name'] = logger.name if logger else None
+        return state
+
+    def __setstate__(self, state):
+        logger_name = state.pop('logger_name')
+        self.__dict__.update(state)
+        self.__dict__.setdefault('line_counts', collections.defaultdict(int))
+        self.__dict__.setdefault('item_fields', None)
+        self.__dict__.setdefault('item_columns', None)
+        self._item_projection = None
+        self.logger = logging.getLogger(logger_name) if logger_name else None
+        self._handlers = self.bind_handlers()
+
+    def bind_handlers(self):
+        """data type -> (bound handler, expected line length) dispatch table"""
+        handlers = dict((data_type, (getattr(self, handler), self.FIELD_COUNTS[data_type] + 1))
+                        for data_type, handler in self.DATA_TYPES.items())
+        if self.item_fields is not None:
+            self._item_projection = ItemPrice.projection(self.item_fields)
+            handlers["I"] = (self.add_projected_item_price, handlers["I"][1])
+        if self.item_columns is not None:
+            handlers["I"] = (self.add_item_price_columns, handlers["I"][1])
+        return handlers
 
     def process_file(self, file):
         """line processor that initializes empty adjustments"""
-        [self.process_line(line.rstrip()) for line in file]
+        process_line = self.process_line
+        for line in file:
+            process_line(line.rstrip())
 
     def process_line(self, line):
-        fields = line.split("|")
-        field_type = fields[0]
-        type = self.DATA_TYPES.get(field_type)
-        if type:
-            exec "self.%s(%s)" % (type, fields[1:])
-        else:
+        fields = line.split(INPUT_DELIMITER)
+        handler = self._handlers.get(fields[0])
+        if not handler:
             raise Exception("Invalid data type on line: %s" % line)
 
+        add_record, fields_count = handler
+        if len(fields) != fields_count:
+            raise Exception("Invalid number of fields on line: %s" % line)
+        add_record(fields[1:])
+        self.line_counts[fields[0]] += 1
+
     def add_header(self, fields):
         oid, external_id, description, event, rule_name = fields
         self.oid = oid
@@ -94,8 +165,51 @@ class Adjustment(object):
     def add_item_price(self, fields):
         self.item_price.append(ItemPrice(*fields))
 
+    def add_projected_item_price(self, fields):
+        self.item_price.append(ItemPrice.projected(fields, self._item_projection))
+
+    def add_item_price_columns(self, fields):
+        self.item_columns.append(fields[ItemPrice.STYLE_CODE_FIELD], fields[ItemPrice.PRICE_FIELD],
+                                 fields[ItemPrice.START_DATE_FIELD], fields[ItemPrice.END_DATE_FIELD])
+
+    def item_styles(self):
+        """distinct style codes of item prices"""
+        if self.item_columns is not None:
+            return set(self.item_columns.styles)
+        return set(item_price.item_style_code for item_price in self.item_price)
+
+
+def read_adjustments(data, event=None, logger=None, item_fields=None, item_columns=False):
+    """
+    Single pass reader of adjustments concatenated in one file.
+    Every 'A' header line starts a new adjustment; adjustments of other events (when event is given)
+    are skipped line by line without building any objects, lines before the first header are ignored.
+    Yields adjustments one by one, so only the current adjustment is kept in memory.
+    item_fields: ItemPrice fields kept by adjustments, all fields by default
+    item_columns: item prices are kept in columns
+    """
+    adjustment = None
+    for line in data:
+        line = line.rstrip()
+        if line.startswith(HEADER_PREFIX):
+            if adjustment is not None:
+                yield adjustment
+                adjustment = None
+            fields = line.split(INPUT_DELIMITER)
+            header_event = fields[HEADER_EVENT_FIELD].strip() if len(fields) > HEADER_EVENT_FIELD else None
+            if event is None or header_event == event:
+                adjustment = Adjustment(logger=logger, item_fields=item_fields, item_columns=item_columns)
+
+        if adjustment is not None:
+            adjustment.process_line(line)
+
+    if adjustment is not None:
+        yield adjustment
+
 
 class AdjustmentDescription(object):
+    __slots__ = ('language_id', 'description', 'image')
+
     def __init__(self, language_id, description, image):
         self.language_id = language_id
         self.description = description
@@ -103,15 +217,25 @@ class AdjustmentDescription(object):
 
 
 class AdjustmentSchedule(object):
+    """
+    Dates are checked when the schedule is parsed, datetime values are made on first use
+    """
+    __slots__ = ('_start_date_text', '_end_date_text', '_start_date_value', '_end_date_value',
+                 'start_time', 'duration', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
     INPUT_DATE_FORMAT = "%Y-%m-%d"
+    """ dates accepted by strptime with INPUT_DATE_FORMAT """
+    INPUT_DATE_PATTERN = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})\Z')
     EXPORT_FORMATS = {
         "USA": "%m/%d/%Y",
         "CAN": "%m/%d/%Y"
     }
 
     def __init__(self, start_date, end_date, start_time, duration, mon, tue, wed, thu, fri, sat, sun):
-        self._start_date = datetime.datetime.strptime(start_date, self.INPUT_DATE_FORMAT) if start_date else ''
-        self._end_date = datetime.datetime.strptime(end_date, self.INPUT_DATE_FORMAT) if end_date else ''
+        self._start_date_text = self.check_date(start_date)
+        self._end_date_text = self.check_date(end_date)
+        self._start_date_value = None
+        self._end_date_value = None
         self.start_time = start_time
         self.duration = duration
         self.mon = mon
@@ -122,6 +246,34 @@ class AdjustmentSchedule(object):
         self.sat = sat
         self.sun = sun
 
+    def check_date(self, date):
+        """date text of the schedule line, ValueError for a date strptime would not parse"""
+        if not date:
+            return date
+        match = self.INPUT_DATE_PATTERN.match(date)
+        try:
+            if match is None:
+                raise ValueError()
+            datetime.date(*[int(part) for part in match.groups()])
+        except ValueError:
+            raise ValueError("Invalid schedule date {0}, YYYY-MM-DD expected".format(date))
+        return date
+
+    def parse_date(self, date):
+        return datetime.datetime.strptime(date, self.INPUT_DATE_FORMAT) if date else ''
+
+    @property
+    def _start_date(self):
+        if self._start_date_value is None:
+            self._start_date_value = self.parse_date(self._start_date_text)
+        return self._start_date_value
+
+    @property
+    def _end_date(self):
+        if self._end_date_value is None:
+            self._end_date_value = self.parse_date(self._end_date_text)
+        return self._end_date_value
+
     def start_date(self, country="USA"):
         return datetime.datetime.strftime(self._start_date, self.EXPORT_FORMATS[country]) if self._start_date else ''
 
@@ -130,6 +282,8 @@ class AdjustmentSchedule(object):
 
 
 class AdjustmentParameters(object):
+    __slots__ = ('name', 'value', 'currency')
+
     def __init__(self, name, value, currency):
         self.name = name
         self.value = value
@@ -137,6 +291,8 @@ class AdjustmentParameters(object):
 
 
 class HierarchyNode(object):
+    __slots__ = ('node_type', 'include_exclude_flag', 'hierarchy_oid', 'hierarchy_name')
+
     def __init__(self, node_type, include_exclude_flag, hierarchy_oid, hierarchy_name):
         self.node_type = node_type
         self.include_exclude_flag = include_exclude_flag
@@ -145,23 +301,31 @@ class HierarchyNode(object):
 
 
 class UserHierarchyNode(HierarchyNode):
+    __slots__ = ()
+
     def __init__(self, node_type, include_exclude_flag, hierarchy_oid, hierarchy_name):
         super(UserHierarchyNode, self).__init__(node_type, include_exclude_flag, hierarchy_oid, hierarchy_name)
 
 
 class CustomerHierarchyNode(HierarchyNode):
+    __slots__ = ('customer_external_id',)
+
     def __init__(self, node_type, include_exclude_flag, hierarchy_oid, hierarchy_name, customer_external_id):
         super(CustomerHierarchyNode, self).__init__(node_type, include_exclude_flag, hierarchy_oid, hierarchy_name)
         self.customer_external_id = customer_external_id
 
 
 class LocationHierarchyNode(HierarchyNode):
+    __slots__ = ('location_external_id',)
+
     def __init__(self, node_type, include_exclude_flag, hierarchy_oid, hierarchy_name, location_external_id):
         super(LocationHierarchyNode, self).__init__(node_type, include_exclude_flag, hierarchy_oid, hierarchy_name)
         self.location_external_id = location_external_id
 
 
 class ProductHierarchyNode(HierarchyNode):
+    __slots__ = ('product_group_id', 'item_name')
+
     def __init__(self, node_type, include_exclude_flag, hierarchy_oid, hierarchy_name, product_group_id, item_name):
         super(ProductHierarchyNode, self).__init__(node_type, include_exclude_flag, hierarchy_oid, hierarchy_name)
         self.product_group_id = product_group_id
@@ -169,6 +333,8 @@ class ProductHierarchyNode(HierarchyNode):
 
 
 class LocationBusiness(object):
+    __slots__ = ('external_id', 'pricing_zone', 'business_unit')
+
     def __init__(self, external_id, pricing_zone, business_unit):
         self.external_id = external_id  # store id
         self.pricing_zone = pricing_zone
@@ -179,11 +345,25 @@ class LocationBusiness(object):
                (self.external_id, self.pricing_zone, self.business_unit)
 
 class CustomerBusiness(object):
+    __slots__ = ('external_id',)
+
     def __init__(self, external_id):
         self.external_id = external_id
 
 
 class ItemPrice(object):
+    __slots__ = ('user_hierarchy_oid', 'user_hierarchy_name',
+                 'customer_hierarchy_oid', 'customer_hierarchy_name', 'customer_external_id',
+                 'location_hierarchy_oid', 'location_hierarchy_name', 'location_external_id',
+                 'start_date', 'end_date', 'product_group_id', 'item_style_code', 'item_color', 'variant_item_name',
+                 'item_price', 'currency')
+
+    """ positions of the fields in item price line """
+    STYLE_CODE_FIELD = __slots__.index('item_style_code')
+    PRICE_FIELD = __slots__.index('item_price')
+    START_DATE_FIELD = __slots__.index('start_date')
+    END_DATE_FIELD = __slots__.index('end_date')
+
     def __init__(self, user_hierarchy_oid, user_hierarchy_name,
                  customer_hierarchy_oid, customer_hierarchy_name, customer_external_id,
                  location_hierarchy_oid, location_hierarchy_name, location_external_id,
@@ -208,3 +388,16 @@ class ItemPrice(object):
         self.variant_item_name = variant_item_name
         self.item_price = item_price
         self.currency = currency
+
+    @classmethod
+    def projection(cls, field_names):
+        """(slot, position in line fields) of every projected field"""
+        return [(getattr(cls, name), cls.__slots__.index(name)) for name in field_names]
+
+    @classmethod
+    def projected(cls, fields, projection):
+        """item price with the projected fields only, other fields are not set"""
+        item_price = cls.__new__(cls)
+        for slot, position in projection:
+            slot.__set__(item_price, fields[position])
+        return item_price
@@ -1,17 +1,51 @@
-import collections
+import array
+import cPickle
 import glob
 import os
 
-READ_FILE_OPTION = 'r'
+from app.input_files import open_input
+
 INPUT_DELIMITER = '|'
+READ_CACHE_OPTION = 'rb'
+WRITE_CACHE_OPTION = 'wb'
+CACHE_FILE_NAME = 'color_map.cache'
+
+ITEM_INFO_FIELDS = ('variant_code', 'description', 'a', 'style_code', 'c', 'd', 'e', 'f', 'color',
+                    'size', 'g', 'filter_code', 'h')
+VARIANT_CODE, DESCRIPTION, STYLE_CODE, COLOR, FILTER_CODE = \
+    [ITEM_INFO_FIELDS.index(name) for name in ('variant_code', 'description', 'style_code', 'color', 'filter_code')]
+
+ROW_INDEX_TYPE = 'i'
+NO_ROW = -1
+
+
+class SharedTable(object):
+    """
+    Table of repeated values (colors, descriptions): every distinct value is stored once
+    and referenced by its position
+    """
+    def __init__(self):
+        self.values = []
+        self._positions = {}
+
+    def position(self, value):
+        position = self._positions.get(value)
+        if position is None:
+            position = self._positions[value] = len(self.values)
+            self.values.append(value)
+        return position
 
 
 class ColorMap(object):
     """
     Colors two-dimensional map (style_code, variant_code)
+
+    Item rows are kept in parallel arrays: variant code, color and description positions in shared tables
+    and the previous row of the same style. A style refers to its last row, so variants of a style
+    are a chain of rows in the order of item information file.
+    When styles are given, only rows of these style codes are loaded.
     """
-    def __init__(self, logger, path_to_files, filename):
-        INCLUDE_COLOR_VALUE = '0'
+    def __init__(self, logger, path_to_files, filename, cache_dir=None, styles=None):
         try:
             files_list = glob.iglob(os.path.join(path_to_files, filename))
             self.item_info_name = max(files_list, key=os.path.getctime)
@@ -20,26 +54,126 @@ class ColorMap(object):
             logger.error(message)
             raise SystemExit(message)
 
-        self._color_map = collections.defaultdict(dict)
+        self._last_rows = {}
+        self._variant_codes = []
+        self._color_ids = array.array(ROW_INDEX_TYPE)
+        self._description_ids = array.array(ROW_INDEX_TYPE)
+        self._previous_rows = array.array(ROW_INDEX_TYPE)
+        self._colors = []
+        self._descriptions = []
         self.filter_counter = 0
 
-        ItemInfo = collections.namedtuple('ItemInfo',
-                                          ['variant_code', 'description', 'a', 'style_code', 'c', 'd', 'e', 'f',
-                                           'color',
-                                           'size', 'g', 'filter_code', 'h'])
-        with open(self.item_info_name, READ_FILE_OPTION) as item_info_file:
-            lines = [line.split(INPUT_DELIMITER) for line in item_info_file]
+        cache_key = self.cache_key(self.item_info_name)
+        # the cache holds the full map, a map limited to some styles is not cached
+        cache_file = os.path.join(cache_dir, CACHE_FILE_NAME) if cache_dir and styles is None else None
+
+        if cache_file and self.load_cache(cache_file, cache_key):
+            logger.info("Color map cache hit: {0}".format(cache_file))
+        else:
+            if cache_file:
+                logger.info("Color map cache miss: {0}".format(cache_file))
+            self.build(self.item_info_name, styles)
+            if cache_file:
+                self.save_cache(cache_file, cache_key)
+
+        logger.info("Color map loaded: {0}".format(self.item_info_name))
+
+    def build(self, item_info_name, styles=None):
+        """streaming build: item information file is read line by line"""
+        INCLUDE_COLOR_VALUE = '0'
+        fields_count = len(ITEM_INFO_FIELDS)
 
-            for item in map(ItemInfo._make, lines):
-                if item.filter_code <> INCLUDE_COLOR_VALUE:  # TODO: check out the exclude color variants
+        last_rows = {}
+        variant_codes = []
+        color_ids = array.array(ROW_INDEX_TYPE)
+        description_ids = array.array(ROW_INDEX_TYPE)
+        previous_rows = array.array(ROW_INDEX_TYPE)
+        colors = SharedTable()
+        descriptions = SharedTable()
+        self.filter_counter = 0
+
+        with open_input(item_info_name) as item_info_file:
+            for line in item_info_file:
+                if styles is not None and line.split(INPUT_DELIMITER, STYLE_CODE + 1)[STYLE_CODE] not in styles:
+                    continue
+
+                item = line.split(INPUT_DELIMITER)
+                if len(item) != fields_count:
+                    raise Exception("Invalid item information line: %s" % line)
+
+                if item[FILTER_CODE] != INCLUDE_COLOR_VALUE:  # TODO: check out the exclude color variants
                     self.filter_counter += 1
                     continue
-                self._color_map[item.style_code][item.variant_code] = (item.color, item.description)
 
-        logger.info("Color map loaded: {0}".format(self.item_info_name))
+                style_code = item[STYLE_CODE]
+                previous_rows.append(last_rows.get(style_code, NO_ROW))
+                last_rows[style_code] = len(variant_codes)
+                variant_codes.append(item[VARIANT_CODE])
+                color_ids.append(colors.position(item[COLOR]))
+                description_ids.append(descriptions.position(item[DESCRIPTION]))
+
+        self._last_rows = last_rows
+        self._variant_codes = variant_codes
+        self._color_ids = color_ids
+        self._description_ids = description_ids
+        self._previous_rows = previous_rows
+        self._colors = colors.values
+        self._descriptions = descriptions.values
+
+    @staticmethod
+    def cache_key(item_info_name):
+        """identity of item information file: the cache is valid while the file is not changed"""
+        stat = os.stat(item_info_name)
+        return os.path.abspath(item_info_name), stat.st_size, stat.st_mtime
+
+    def load_cache(self, cache_file, cache_key):
+        """
+        Cache file contains two pickles: the key of item information file and the map itself,
+        so a stale cache is detected without loading the map
+        """
+        if not os.path.isfile(cache_file):
+            return False
+        try:
+            with open(cache_file, READ_CACHE_OPTION) as cache:
+                unpickler = cPickle.Unpickler(cache)
+                if unpickler.load() != cache_key:
+                    return False
+                (self._last_rows, self._variant_codes, self._color_ids, self._description_ids,
+                 self._previous_rows, self._colors, self._descriptions, self.filter_counter) = unpickler.load()
+        except (EOFError, cPickle.UnpicklingError, ValueError, TypeError):
+            return False
+        return True
+
+    def save_cache(self, cache_file, cache_key):
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        temporary_file = "{0}.{1}.tmp".format(cache_file, os.getpid())
+        with open(temporary_file, WRITE_CACHE_OPTION) as cache:
+            pickler = cPickle.Pickler(cache, cPickle.HIGHEST_PROTOCOL)
+            pickler.dump(cache_key)
+            pickler.dump((self._last_rows, self._variant_codes, self._color_ids, self._description_ids,
+                          self._previous_rows, self._colors, self._descriptions, self.filter_counter))
+        os.rename(temporary_file, cache_file)
 
     def get_colors(self, style_id):
-        return self._color_map.get(style_id)
+        """variant_code -> (color, description) of the style, None for unknown style"""
+        row = self._last_rows.get(style_id, NO_ROW)
+        if row == NO_ROW:
+            return None
+
+        rows = []
+        while row != NO_ROW:
+            rows.append(row)
+            row = self._previous_rows[row]
+
+        colors, descriptions = self._colors, self._descriptions
+        return dict((self._variant_codes[row],
+                     (colors[self._color_ids[row]], descriptions[self._description_ids[row]]))
+                    for row in reversed(rows))
+
+    def __contains__(self, style_id):
+        return style_id in self._last_rows
 
     def keys(self):
-        return self._color_map.keys()
+        return self._last_rows.keys()
@@ -0,0 +1,72 @@
+"""
+Concurrent loading of independent inputs: the log and the results are the same as of loading them one by one
+"""
+import logging
+from multiprocessing.pool import ThreadPool
+
+
+class DeferredLogger(object):
+    """
+    Logger of a concurrent task: records are kept until the task is replayed in its turn
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.name = logger.name
+        self.records = []
+
+    def log(self, level, message, *args, **kwargs):
+        self.records.append((level, message, args, kwargs))
+
+    def debug(self, message, *args, **kwargs):
+        self.log(logging.DEBUG, message, *args, **kwargs)
+
+    def info(self, message, *args, **kwargs):
+        self.log(logging.INFO, message, *args, **kwargs)
+
+    def warning(self, message, *args, **kwargs):
+        self.log(logging.WARNING, message, *args, **kwargs)
+
+    def error(self, message, *args, **kwargs):
+        self.log(logging.ERROR, message, *args, **kwargs)
+
+    def replay(self):
+        for level, message, args, kwargs in self.records:
+            self.logger.log(level, message, *args, **kwargs)
+        self.records = []
+
+
+def run_task(arguments):
+    """thread pool task: (result, None) of the loader, (None, error) when it fails"""
+    (name, loader), logger = arguments
+    try:
+        return loader(logger), None
+    except (Exception, SystemExit) as error:
+        # SystemExit of a loader would stop the pool thread and the pool would wait for its result forever
+        return None, error
+
+
+def load_concurrently(tasks, logger):
+    """
+    Results of (input name, loader of a logger) tasks run at once in a thread pool, in the order of tasks.
+    Logs of the tasks are written in the order of tasks when all of them are finished.
+    A failed input does not stop the others: errors of all inputs are logged and raised together
+    """
+    loggers = [DeferredLogger(logger) for task in tasks]
+    pool = ThreadPool(len(tasks))
+    try:
+        outcomes = pool.map(run_task, zip(tasks, loggers))
+    finally:
+        pool.close()
+        pool.join()
+
+    failed_inputs = []
+    for (name, loader), task_logger, (result, error) in zip(tasks, loggers, outcomes):
+        task_logger.replay()
+        if error is not None:
+            logger.error("Input {0} is not loaded: {1}".format(name, error))
+            failed_inputs.append(name)
+    if failed_inputs:
+        raise Exception("Inputs are not loaded: {0}".format(", ".join(failed_inputs)))
+
+    return [result for result, error in outcomes]
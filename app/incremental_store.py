@@ -0,0 +1,96 @@
+import cPickle
+import hashlib
+import os
+import threading
+
+READ_STORE_OPTION = 'rb'
+WRITE_STORE_OPTION = 'wb'
+MANIFEST_NAME = 'manifest.pickle'
+DATA_FILE_EXTENSION = '.pickle'
+
+
+class IncrementalStore(object):
+    """
+    Parsed input files kept between runs.
+    Manifest maps every input file to its fingerprint (size, mtime and parsing parameters)
+    and to the pickle of its parsed data; the data is reused while the fingerprint is the same.
+    Inputs loaded concurrently share the store, manifest and counters are changed under a lock.
+    cold: the store had no data when it was opened, every file of the run is parsed for the first time
+    """
+
+    def __init__(self, store_dir, logger):
+        self.store_dir = store_dir
+        self.logger = logger
+        self.reused = 0
+        self.parsed = 0
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+
+        self._manifest = self.load_pickle(os.path.join(store_dir, MANIFEST_NAME)) or {}
+        self.cold = not self._manifest
+
+    @staticmethod
+    def fingerprint(path, parameters):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime, parameters
+
+    @staticmethod
+    def load_pickle(path):
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, READ_STORE_OPTION) as stored:
+                return cPickle.load(stored)
+        except (EOFError, cPickle.UnpicklingError, ValueError, TypeError, AttributeError, ImportError):
+            # data of another version of parsed classes is parsed again
+            return None
+
+    @staticmethod
+    def save_pickle(path, data):
+        temporary_file = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(temporary_file, WRITE_STORE_OPTION) as stored:
+            cPickle.dump(data, stored, cPickle.HIGHEST_PROTOCOL)
+        os.rename(temporary_file, path)
+
+    def load(self, path, parameters=None):
+        """stored data of unchanged file, None when the file is new or changed"""
+        path = os.path.abspath(path)
+        entry = self._manifest.get(path)
+        if not entry or entry[0] != self.fingerprint(path, parameters):
+            return None
+
+        data = self.load_pickle(os.path.join(self.store_dir, entry[1]))
+        if data is not None:
+            with self._lock:
+                self.reused += 1
+        return data
+
+    def save(self, path, data, parameters=None):
+        path = os.path.abspath(path)
+        data_file = hashlib.sha1(path).hexdigest() + DATA_FILE_EXTENSION
+        self.save_pickle(os.path.join(self.store_dir, data_file), data)
+        with self._lock:
+            self._manifest[path] = (self.fingerprint(path, parameters), data_file)
+            self.parsed += 1
+
+    def prune(self):
+        """forget input files that do not exist anymore, their data files are removed"""
+        with self._lock:
+            removed = [path for path in self._manifest if not os.path.isfile(path)]
+            for path in removed:
+                data_path = os.path.join(self.store_dir, self._manifest.pop(path)[1])
+                if os.path.isfile(data_path):
+                    os.remove(data_path)
+        return len(removed)
+
+    def commit(self):
+        """write manifest without removed input files and report reused and re-parsed files of the run"""
+        removed = self.prune()
+        if removed:
+            self.logger.info("Incremental store: {0} removed files forgotten".format(removed))
+        self.save_pickle(os.path.join(self.store_dir, MANIFEST_NAME), self._manifest)
+        self.logger.info("Incremental store: {0} files reused, {1} files re-parsed".format(self.reused,
+                                                                                        self.parsed))
+        self.reused = self.parsed = 0
@@ -0,0 +1,101 @@
+"""
+Input files of the generator: gzip, bzip2 and xz files are decompressed as they are read, line by line
+"""
+import bz2
+import gzip
+import io
+import os
+import subprocess
+
+try:
+    from backports import lzma
+except ImportError:  # pragma: no cover
+    lzma = None
+
+READ_FILE_OPTION = 'r'
+READ_BUFFER_SIZE = 1 << 20
+
+GZIP = 'gzip'
+BZIP2 = 'bzip2'
+XZ = 'xz'
+COMPRESSION_EXTENSIONS = {
+    '.gz': GZIP,
+    '.bz2': BZIP2,
+    '.xz': XZ
+}
+MAGIC_BYTES = [
+    ('\x1f\x8b', GZIP),
+    ('BZh', BZIP2),
+    ('\xfd7zXZ\x00', XZ)
+]
+MAGIC_LENGTH = max(len(magic) for magic, compression in MAGIC_BYTES)
+XZ_COMMAND = ['xz', '--decompress', '--stdout']
+
+
+def compression_of(path):
+    """compression of the file by its extension, by its first bytes for other names; None for plain file"""
+    compression = COMPRESSION_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if compression:
+        return compression
+
+    with open(path, 'rb') as input_file:
+        head = input_file.read(MAGIC_LENGTH)
+    for magic, compression in MAGIC_BYTES:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def is_compressed(path):
+    return compression_of(path) is not None
+
+
+def open_input(path, buffer_size=READ_BUFFER_SIZE):
+    """
+    Input file for line by line reading; compressed data is decompressed in buffer_size reads as lines are taken,
+    so memory use does not depend on the size of the file
+    """
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, READ_FILE_OPTION, buffer_size)
+    if compression == GZIP:
+        return io.BufferedReader(gzip.GzipFile(path, 'rb'), buffer_size)
+    if compression == BZIP2:
+        return bz2.BZ2File(path, 'r', buffer_size)
+    if lzma is not None:
+        return io.BufferedReader(lzma.LZMAFile(path, 'rb'), buffer_size)
+    return XzProcessFile(path, buffer_size)
+
+
+class XzProcessFile(object):
+    """
+    Lines of xz file decompressed by xz command, used when lzma module is not installed.
+    The command decompresses in its own process while lines are parsed
+    """
+
+    def __init__(self, path, buffer_size=READ_BUFFER_SIZE):
+        self.path = path
+        try:
+            self.process = subprocess.Popen(XZ_COMMAND + [path], stdout=subprocess.PIPE, bufsize=buffer_size)
+        except OSError as error:
+            raise Exception("Cannot read {0}: install backports.lzma or xz command ({1})".format(path, error))
+
+    def __iter__(self):
+        return iter(self.process.stdout)
+
+    def read(self, size=-1):
+        return self.process.stdout.read(size)
+
+    def close(self):
+        if self.process.stdout.closed:
+            return None
+        self.process.stdout.close()
+        if self.process.wait() not in (0, -13):
+            # -13: SIGPIPE of the command when the file is closed before its end
+            raise Exception("xz failed to decompress {0}".format(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
@@ -0,0 +1,104 @@
+"""
+Columnar item prices of an adjustment and per-style price aggregates.
+Columns are array module buffers: compact and picklable, the group-by is one pass over them
+"""
+import array
+import math
+
+STYLE_CODE_TYPE = 'i'
+PERIOD_CODE_TYPE = 'i'
+PRICE_TYPE = 'd'
+NO_PRICE = float('nan')
+PRICE_FORMAT = '{0:.2f}'
+
+
+def parse_price(value):
+    """price of item price line, NaN for an empty or invalid price"""
+    try:
+        return float(value)
+    except ValueError:
+        return NO_PRICE
+
+
+def format_price(price):
+    return '' if price is None or math.isnan(price) else PRICE_FORMAT.format(price)
+
+
+def promotion_factor(value):
+    """
+    Price multiplier of PromotionPct parameter, None when it is not set.
+    Input files carry the percent off both as negative (-10) and positive (60) numbers, the sign is ignored
+    """
+    try:
+        return 1 - abs(float(value)) / 100
+    except (TypeError, ValueError):
+        return None
+
+
+class ItemPriceColumns(object):
+    """
+    Style code, price and (start date, end date) period of every item price line of an adjustment in columns.
+    Style and period codes are category codes: index of the style in styles and of the period in periods,
+    both are in the order of first line
+    """
+
+    def __init__(self):
+        self.styles = []
+        self.style_codes = array.array(STYLE_CODE_TYPE)
+        self.prices = array.array(PRICE_TYPE)
+        self.periods = []
+        self.period_codes = array.array(PERIOD_CODE_TYPE)
+        self._codes = {}
+        self._period_codes = {}
+
+    def append(self, style, price, start_date='', end_date=''):
+        code = self._codes.get(style)
+        if code is None:
+            code = self._codes[style] = len(self.styles)
+            self.styles.append(style)
+        self.style_codes.append(code)
+        self.prices.append(parse_price(price))
+
+        # lines of an adjustment mostly have the same dates, the period of the previous line is checked first
+        period = self.periods[self.period_codes[-1]] if self.period_codes else None
+        if period is None or period[0] != start_date or period[1] != end_date:
+            period = start_date, end_date
+            period_code = self._period_codes.get(period)
+            if period_code is None:
+                period_code = self._period_codes[period] = len(self.periods)
+                self.periods.append(period)
+        else:
+            period_code = self.period_codes[-1]
+        self.period_codes.append(period_code)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def price_ranges(self):
+        """(min price, max price) of every style by category code, NaN for a style without valid prices"""
+        if not self.styles:
+            return []
+        minimums = [NO_PRICE] * len(self.styles)
+        maximums = [NO_PRICE] * len(self.styles)
+        for code, price in zip(self.style_codes, self.prices):
+            if price != price:
+                continue
+            # comparisons with NaN are false: the first valid price of a style replaces it
+            if not minimums[code] <= price:
+                minimums[code] = price
+            if not maximums[code] >= price:
+                maximums[code] = price
+        return zip(minimums, maximums)
+
+    def style_periods(self):
+        """distinct (style, start date, end date) of item price lines, dates as they are in the lines"""
+        return set((self.styles[code],) + self.periods[period_code]
+                   for code, period_code in set(zip(self.style_codes, self.period_codes)))
+
+    def __getstate__(self):
+        return self.styles, self.style_codes, self.prices, self.periods, self.period_codes
+
+    def __setstate__(self, state):
+        self.styles, self.style_codes, self.prices, self.periods, self.period_codes = state
+        self._codes = dict((style, code) for code, style in enumerate(self.styles))
+        self._period_codes = dict((period, code) for code, period in enumerate(self.periods))
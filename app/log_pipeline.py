@@ -0,0 +1,196 @@
+"""
+Logging of the generator: one handler per log file, optional writing in a background thread
+and aggregation of repeated per-adjustment warnings
+"""
+import atexit
+import collections
+import logging
+import os
+import Queue
+import threading
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+""" record attributes of an aggregated warning, see warning_extra """
+WARNING_KIND_ATTRIBUTE = 'warning_kind'
+WARNING_OID_ATTRIBUTE = 'oid'
+""" OIDs of every kind of warnings quoted in the summary """
+SAMPLE_OIDS = 5
+
+""" shared handlers by (log file, asynchronous) """
+_log_handlers = {}
+_log_handlers_lock = threading.Lock()
+
+
+def warning_extra(kind, oid):
+    """extra of logging call of a warning aggregated by kind"""
+    return {WARNING_KIND_ATTRIBUTE: kind, WARNING_OID_ATTRIBUTE: oid}
+
+
+def shared_log_handler(path, asynchronous=False):
+    """
+    The only handler of the log file in the process, all loggers of the file share it.
+    Asynchronous handler passes records to a listener thread that writes them to the file and to the console
+    """
+    key = os.path.abspath(path), asynchronous
+    with _log_handlers_lock:
+        handler = _log_handlers.get(key)
+        if handler is None:
+            file_handler = logging.FileHandler(path)
+            file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            if asynchronous:
+                listener = QueueListener([file_handler] + logging.root.handlers)
+                listener.start()
+                handler = QueueHandler(listener)
+            else:
+                handler = file_handler
+            _log_handlers[key] = handler
+        return handler
+
+
+def flush_logs():
+    """write the records queued by asynchronous handlers"""
+    with _log_handlers_lock:
+        handlers = _log_handlers.values()
+    for handler in handlers:
+        if isinstance(handler, QueueHandler):
+            handler.listener.stop()
+
+
+class QueueListener(object):
+    """
+    Thread writing queued records to the handlers
+    """
+    STOP = None
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.queue = Queue.Queue()
+        self.pid = os.getpid()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and os.getpid() == self.pid
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='log-listener')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is self.STOP:
+                break
+            self.dispatch(record)
+
+    def dispatch(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def stop(self):
+        """write queued records and stop the thread, records logged later are written directly"""
+        if not self.running:
+            return None
+        thread, self._thread = self._thread, None
+        self.queue.put(self.STOP)
+        thread.join()
+
+
+class QueueHandler(logging.Handler):
+    """
+    Records are queued for the listener thread, so logging does not wait for the file.
+    When the listener is stopped, or in a forked process where it does not run, records are written directly
+    """
+
+    def __init__(self, listener):
+        logging.Handler.__init__(self)
+        self.listener = listener
+
+    def emit(self, record):
+        if not self.listener.running:
+            self.listener.dispatch(record)
+            return None
+        try:
+            # message is formed now: arguments may change before the listener writes it
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.listener.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+class WarningKind(object):
+    """number of warnings of one kind, number of logged ones and sample OIDs"""
+    __slots__ = ('count', 'logged', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.logged = 0
+        self.samples = []
+
+    def __getstate__(self):
+        return self.count, self.logged, self.samples
+
+    def __setstate__(self, state):
+        self.count, self.logged, self.samples = state
+
+
+class WarningAggregator(logging.Filter):
+    """
+    Logger filter grouping warnings logged with warning_extra by kind.
+    sample_rate: share of the warnings of every kind that are logged one by one (first one and every n-th after it),
+    all of them are counted in the summary
+    """
+
+    def __init__(self, sample_rate=1.0):
+        logging.Filter.__init__(self)
+        if not 0 <= sample_rate <= 1:
+            raise Exception("Log sample rate {0} is not between 0 and 1".format(sample_rate))
+        self.step = int(round(1 / sample_rate)) if sample_rate else 0
+        self.kinds = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        kind = getattr(record, WARNING_KIND_ATTRIBUTE, None)
+        if kind is None:
+            return True
+
+        with self._lock:
+            warnings = self.kinds.get(kind)
+            if warnings is None:
+                warnings = self.kinds[kind] = WarningKind()
+            logged = bool(self.step) and warnings.count % self.step == 0
+            warnings.count += 1
+            if logged:
+                warnings.logged += 1
+            if len(warnings.samples) < SAMPLE_OIDS:
+                warnings.samples.append(getattr(record, WARNING_OID_ATTRIBUTE, None))
+        return logged
+
+    def drain(self):
+        """counted warnings by kind, counting starts again"""
+        with self._lock:
+            kinds, self.kinds = self.kinds, collections.OrderedDict()
+        return kinds
+
+    def merge(self, kinds):
+        """add warnings counted in another process"""
+        with self._lock:
+            for kind, other in kinds.items():
+                warnings = self.kinds.get(kind)
+                if warnings is None:
+                    warnings = self.kinds[kind] = WarningKind()
+                warnings.count += other.count
+                warnings.logged += other.logged
+                warnings.samples.extend(other.samples[:SAMPLE_OIDS - len(warnings.samples)])
+
+    def log_summary(self, logger):
+        for kind, warnings in self.drain().items():
+            logger.warning("Warnings {0}: {1} adjustments, {2} logged, sample OIDs: {3}".format(
+                kind, warnings.count, warnings.logged, ", ".join(str(oid) for oid in warnings.samples)))
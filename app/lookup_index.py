@@ -0,0 +1,191 @@
+"""
+Disk-backed lookup of pipe delimited files: sorted keys mapped to byte offsets of their rows
+"""
+import collections
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+INPUT_DELIMITER = '|'
+READ_FILE_OPTION = 'rb'
+WRITE_FILE_OPTION = 'wb'
+INDEX_FILE_EXTENSION = '.index'
+
+"""
+Index file: header (magic, size and mtime of indexed file, keys count), row offsets of sorted keys,
+key boundaries in keys blob (count + 1 offsets) and the blob of sorted keys
+"""
+INDEX_MAGIC = 'PSIDX001'
+INDEX_HEADER = struct.Struct('<8sqdq')
+OFFSET = struct.Struct('<q')
+KEY_RANGE = struct.Struct('<2q')
+
+""" cached result of a key that is not in the file """
+MISSING = object()
+
+
+class IndexedLookup(object):
+    """
+    Read-only dict-like view of a pipe delimited file: key is the first field, value is the list of the other fields.
+    The index is built in one pass over the file and rebuilt when the file is changed; it is served through mmap
+    and only the rows of looked up keys are read. As in dict loading the last row of a repeated key wins
+    index_dir: directory of index files
+    cache_size: looked up values kept in memory with least recently used eviction, no cache for 0
+    """
+
+    def __init__(self, path, index_dir, cache_size=0):
+        self.path = path
+        self.index_path = os.path.join(index_dir,
+                                       hashlib.sha1(os.path.abspath(path)).hexdigest() + INDEX_FILE_EXTENSION)
+        self.cache_size = cache_size
+        self.rebuilt = False
+        self.count = 0
+
+        self._index = None
+        self._data_file = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+
+        if not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        self.open()
+
+    @staticmethod
+    def fingerprint(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+
+    def open(self):
+        """map the index of the current file, the index is built first when it is missing or out of date"""
+        self.close()
+        fingerprint = self.fingerprint(self.path)
+        if self.read_header() != (INDEX_MAGIC,) + fingerprint:
+            self.build(fingerprint)
+            self.rebuilt = True
+
+        with open(self.index_path, READ_FILE_OPTION) as index_file:
+            self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = INDEX_HEADER.unpack_from(self._index)[3]
+        self._row_offsets = INDEX_HEADER.size
+        self._key_offsets = self._row_offsets + self.count * OFFSET.size
+        self._keys = self._key_offsets + (self.count + 1) * OFFSET.size
+
+        # rows are read with seek: a mapped data file rewritten in place would crash the process
+        self.open_data_file()
+        self._cache.clear()
+
+    def open_data_file(self):
+        """data file of this process: forked workers would share the file offset of an inherited one"""
+        if self._data_file is not None:
+            self._data_file.close()
+        self._data_file = open(self.path, READ_FILE_OPTION)
+        self._pid = os.getpid()
+
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        if self._data_file is not None:
+            self._data_file.close()
+            self._data_file = None
+
+    def read_header(self):
+        """(magic, size, mtime) of indexed file, None when there is no index"""
+        if not os.path.isfile(self.index_path):
+            return None
+        with open(self.index_path, READ_FILE_OPTION) as index_file:
+            header = index_file.read(INDEX_HEADER.size)
+        if len(header) != INDEX_HEADER.size:
+            return None
+        return INDEX_HEADER.unpack(header)[:3]
+
+    def build(self, fingerprint):
+        offsets = {}
+        offset = 0
+        with open(self.path, READ_FILE_OPTION) as data_file:
+            for line in data_file:
+                offsets[line.rstrip().split(INPUT_DELIMITER, 1)[0]] = offset
+                offset += len(line)
+
+        keys = sorted(offsets)
+        key_offsets = [0]
+        for key in keys:
+            key_offsets.append(key_offsets[-1] + len(key))
+
+        temporary_file = "{0}.{1}.tmp".format(self.index_path, os.getpid())
+        with open(temporary_file, WRITE_FILE_OPTION) as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, fingerprint[0], fingerprint[1], len(keys)))
+            index_file.write(struct.pack('<{0}q'.format(len(keys)), *[offsets[key] for key in keys]))
+            index_file.write(struct.pack('<{0}q'.format(len(key_offsets)), *key_offsets))
+            index_file.write(''.join(keys))
+        os.rename(temporary_file, self.index_path)
+
+    def key_at(self, number):
+        start, end = KEY_RANGE.unpack_from(self._index, self._key_offsets + number * OFFSET.size)
+        return self._index[self._keys + start:self._keys + end]
+
+    def find(self, key):
+        """offset of the row of the key in the file, None for unknown key"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.key_at(low) == key:
+            return OFFSET.unpack_from(self._index, self._row_offsets + low * OFFSET.size)[0]
+        return None
+
+    def read_row(self, offset):
+        if self._pid != os.getpid():
+            self.open_data_file()
+        self._data_file.seek(offset)
+        return self._data_file.readline().rstrip().split(INPUT_DELIMITER)
+
+    def lookup(self, key):
+        """value of the key or MISSING, the index is rebuilt when the file is changed under it"""
+        with self._lock:
+            offset = self.find(key)
+            if offset is None:
+                return MISSING
+            row = self.read_row(offset)
+            if row[0] != key:
+                self.open()
+                offset = self.find(key)
+                if offset is None:
+                    return MISSING
+                row = self.read_row(offset)
+            return row[1:]
+
+    def get(self, key, default=None):
+        if not self.cache_size:
+            value = self.lookup(key)
+            return default if value is MISSING else value
+
+        with self._lock:
+            value = self._cache.pop(key, None)
+            if value is not None:
+                self._cache[key] = value
+        if value is None:
+            value = self.lookup(key)
+            with self._lock:
+                self._cache[key] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return default if value is MISSING else value
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __len__(self):
+        return self.count
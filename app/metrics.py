@@ -0,0 +1,170 @@
+import collections
+import contextlib
+import json
+import os
+import resource
+import threading
+import time
+
+WRITE_FILE_OPTION = 'w'
+PROMETHEUS_EXTENSION = '.prom'
+PROMETHEUS_PREFIX = 'promo_'
+PAGE_SIZE_KB = resource.getpagesize() >> 10
+CLEAR_REFS_FILE = '/proc/self/clear_refs'
+""" value of clear_refs that resets the peak resident memory (VmHWM) of the process """
+RESET_PEAK_RSS = '5'
+STATUS_FILE = '/proc/self/status'
+PEAK_RSS_FIELD = 'VmHWM:'
+
+STAGE_METRICS = [
+    ('wall_seconds', 'Wall time of generation stage'),
+    ('cpu_seconds', 'CPU time of the process during generation stage'),
+    ('rss_growth_kb', 'Growth of resident memory of the process during generation stage'),
+    ('peak_rss_kb', 'Peak resident memory of the process during generation stage, the largest of its runs'),
+    ('concurrent', 'Stage ran together with stages of other threads, its CPU time and memory include them'),
+]
+
+
+def cpu_time():
+    """CPU time of the whole process, all threads included"""
+    user, system = os.times()[:2]
+    return user + system
+
+
+def current_rss_kb():
+    """resident memory of the process now, peak RSS where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE_KB
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss():
+    """start a new peak of resident memory, False where the kernel does not allow it"""
+    try:
+        with open(CLEAR_REFS_FILE, 'w') as clear_refs:
+            clear_refs.write(RESET_PEAK_RSS)
+        return True
+    except IOError:
+        return False
+
+
+def peak_rss_since_reset_kb():
+    """peak resident memory since the last reset_peak_rss, None without /proc/self/status"""
+    try:
+        with open(STATUS_FILE) as status:
+            for line in status:
+                if line.startswith(PEAK_RSS_FIELD):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+class RunMetrics(object):
+    """
+    Durations, memory growth and volumes of one generation run.
+    Stage with the same name accumulates times of all its runs, counters are numbers
+    or numbers by the value of one label (line type of lines_parsed).
+    CPU time and memory are measured for the whole process: a stage that runs together with stages
+    of other threads (concurrent loading) is marked concurrent, its numbers include the other stages.
+    Peak memory of a stage is VmHWM after a reset at the start of the stage, resident memory at the start
+    plus its growth where the peak can't be reset
+    """
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+        self.labels = {}
+        """ stages in progress: [thread, concurrent] of every one """
+        self._running = []
+        self._lock = threading.Lock()
+        """ peak of the process before the resets of stage peaks """
+        self._peak_rss_kb = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        thread = threading.current_thread()
+        with self._lock:
+            running = [thread, False]
+            for other in self._running:
+                if other[0] is not thread:
+                    other[1] = running[1] = True
+            self._running.append(running)
+            self._peak_rss_kb = max(self._peak_rss_kb, peak_rss_kb())
+            peak_reset = reset_peak_rss()
+        started, cpu_started, rss_started = time.time(), cpu_time(), current_rss_kb()
+        try:
+            yield
+        finally:
+            wall_seconds, cpu_seconds = time.time() - started, cpu_time() - cpu_started
+            rss_growth_kb = current_rss_kb() - rss_started
+            stage_peak_rss_kb = peak_rss_since_reset_kb() if peak_reset else None
+            if stage_peak_rss_kb is None:
+                stage_peak_rss_kb = rss_started + max(rss_growth_kb, 0)
+            with self._lock:
+                self._running.remove(running)
+                self._peak_rss_kb = max(self._peak_rss_kb, stage_peak_rss_kb)
+                stage = self.stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rss_growth_kb': 0,
+                                                      'peak_rss_kb': 0, 'concurrent': False, 'calls': 0})
+                stage['wall_seconds'] += wall_seconds
+                stage['cpu_seconds'] += cpu_seconds
+                stage['rss_growth_kb'] += rss_growth_kb
+                stage['peak_rss_kb'] = max(stage['peak_rss_kb'], stage_peak_rss_kb)
+                stage['concurrent'] = stage['concurrent'] or running[1]
+                stage['calls'] += 1
+
+    def count(self, name, value=1, **label):
+        """count(name, value) or count(name, value, label_name=label_value)"""
+        with self._lock:
+            if not label:
+                self.counters[name] = self.counters.get(name, 0) + value
+                return None
+
+            (label_name, label_value), = label.items()
+            self.labels[name] = label_name
+            values = self.counters.setdefault(name, collections.OrderedDict())
+            values[label_value] = values.get(label_value, 0) + value
+
+    def peak_rss_kb(self):
+        """peak of the process, resets of stage peaks lower VmHWM and ru_maxrss"""
+        return max(self._peak_rss_kb, peak_rss_kb())
+
+    def to_dict(self):
+        return {'stages': self.stages, 'counters': self.counters, 'peak_rss_kb': self.peak_rss_kb()}
+
+    def write(self, path):
+        """prometheus textfile for .prom file, JSON otherwise"""
+        with open(path, WRITE_FILE_OPTION) as metrics_file:
+            if os.path.splitext(path)[1] == PROMETHEUS_EXTENSION:
+                metrics_file.writelines(line + '\n' for line in self.prometheus_lines())
+            else:
+                json.dump(self.to_dict(), metrics_file, indent=2)
+
+    def prometheus_lines(self):
+        for metric, description in STAGE_METRICS:
+            name = PROMETHEUS_PREFIX + 'stage_' + metric
+            yield '# HELP {0} {1}'.format(name, description)
+            yield '# TYPE {0} gauge'.format(name)
+            for stage, values in self.stages.items():
+                yield '{0}{{stage="{1}"}} {2}'.format(name, stage, int(values[metric]) if metric == 'concurrent'
+                                                      else values[metric])
+
+        name = PROMETHEUS_PREFIX + 'peak_rss_kb'
+        yield '# HELP {0} Peak resident memory of the process'.format(name)
+        yield '# TYPE {0} gauge'.format(name)
+        yield '{0} {1}'.format(name, self.peak_rss_kb())
+
+        for counter, value in self.counters.items():
+            name = PROMETHEUS_PREFIX + counter
+            yield '# TYPE {0} gauge'.format(name)
+            if counter in self.labels:
+                for label_value, labeled_value in value.items():
+                    yield '{0}{{{1}="{2}"}} {3}'.format(name, self.labels[counter], label_value, labeled_value)
+            else:
+                yield '{0} {1}'.format(name, value)
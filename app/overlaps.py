@@ -0,0 +1,107 @@
+"""
+Promotions overlapping on the same style: sorted sweep over (style, start date, end date) intervals of adjustments
+"""
+import csv
+import datetime
+
+from app.adjustment import AdjustmentSchedule
+
+WRITE_FILE_OPTION = 'wb'
+REPORT_DELIMITER = '\t'
+""" ItemPrice fields read by the overlap report, they are parsed in projection mode when the report is written """
+ITEM_PRICE_FIELDS = ('start_date', 'end_date')
+REPORT_COLUMNS = ['Style #', 'Start date', 'End date', 'Adjustments', 'OIDs', 'Promotions']
+OID_SEPARATOR = ' '
+PROMOTION_SEPARATOR = ' | '
+
+
+def input_date(text):
+    """date of YYYY-MM-DD text (month and day may be unpadded as strptime allows), None for empty or invalid text"""
+    match = AdjustmentSchedule.INPUT_DATE_PATTERN.match(text) if text else None
+    if match is None:
+        return None
+    try:
+        return datetime.date(*[int(part) for part in match.groups()])
+    except ValueError:
+        return None
+
+
+def schedule_dates(adjustment):
+    """(start date, end date) of the schedule, None for a date that is not set"""
+    schedule = adjustment.schedule
+    if not schedule:
+        return None, None
+    return tuple(value.date() if value else None for value in (schedule._start_date, schedule._end_date))
+
+
+def adjustment_intervals(adjustment):
+    """
+    (style, start date, end date) intervals of the adjustment: dates of item price lines,
+    schedule dates for lines without valid ones; intervals without dates are skipped
+    """
+    schedule_start, schedule_end = schedule_dates(adjustment)
+
+    if adjustment.item_columns is not None:
+        periods = adjustment.item_columns.style_periods()
+    else:
+        periods = set((item_price.item_style_code, item_price.start_date, item_price.end_date)
+                      for item_price in adjustment.item_price)
+
+    dates = {}
+    intervals = []
+    for style, start_text, end_text in periods:
+        for text in (start_text, end_text):
+            if text not in dates:
+                dates[text] = input_date(text)
+        start_date, end_date = dates[start_text] or schedule_start, dates[end_text] or schedule_end
+        if start_date and end_date:
+            intervals.append((style, start_date, end_date))
+    return intervals
+
+
+def find_overlaps(adjustments):
+    """
+    Conflicts (style, start date, end date, adjustments) of every group of overlapping intervals of one style
+    that belongs to two or more adjustments; start and end are the bounds of the whole group.
+    Intervals are sorted once by style and start date and swept: an interval starting after the end of the current
+    group starts a new one, so n intervals take O(n log n) whatever number of adjustments overlap.
+    Dates are compared as parsed dates, both ends are inclusive
+    """
+    intervals = sorted(set((style, start_date, end_date, number)
+                           for number, adjustment in enumerate(adjustments)
+                           for style, start_date, end_date in adjustment_intervals(adjustment)))
+
+    conflicts = []
+    group = None
+    for style, start_date, end_date, number in intervals:
+        if group is not None and style == group[0] and start_date <= group[2]:
+            group[2] = max(group[2], end_date)
+            group[3].append(number)
+            continue
+        add_conflict(conflicts, group, adjustments)
+        group = [style, start_date, end_date, [number]]
+    add_conflict(conflicts, group, adjustments)
+    return conflicts
+
+
+def add_conflict(conflicts, group, adjustments):
+    if group is None:
+        return None
+    numbers = sorted(set(group[3]))
+    if len(numbers) > 1:
+        conflicts.append((group[0], group[1], group[2], [adjustments[number] for number in numbers]))
+
+
+def write_overlap_report(path, conflicts):
+    """tab delimited report of conflicts, one row per style and overlapping period"""
+    with open(path, WRITE_FILE_OPTION) as report_file:
+        writer = csv.writer(report_file, dialect=csv.excel, delimiter=REPORT_DELIMITER)
+        writer.writerow(REPORT_COLUMNS)
+        for style, start_date, end_date, adjustments in conflicts:
+            promotions = []
+            for adjustment in adjustments:
+                if adjustment.header_description not in promotions:
+                    promotions.append(adjustment.header_description)
+            writer.writerow([style, start_date.isoformat(), end_date.isoformat(), len(adjustments),
+                             OID_SEPARATOR.join(adjustment.oid for adjustment in adjustments),
+                             PROMOTION_SEPARATOR.join(promotions)])
@@ -1,21 +1,46 @@
-import csv
 import calendar
+import cStringIO
 import datetime
 import os
 
+from app.item_price_columns import format_price, promotion_factor
+from app.log_pipeline import warning_extra
+from app.sheet_writers import CsvSheetWriter, XlsSheetWriter, HighlightedRow, DEFAULT_INPUT_ENCODING
+
 PROPERTY_SECTION = 'PROMO_SHEET'
-WRITE_FILE_OPTION = 'wb'
-OUTPUT_DELIMITER = '\t'
 DEFAULT_COUNTRY = 'USA'
+CSV_FORMAT = 'csv'
+XLS_FORMAT = 'xls'
+ALL_COLLORS = 'ALL'
+ALL_COLLORS_QUANTITY = 2
+EMPTY_OTHER_INFO_ROW_PART = ['', '', '', '', '', '', '', '', '']
+EMPTY_MARCHANDISING_SIGNAGE = ['']
+PRICE_COLUMNS = ['MIN PRICE', 'MAX PRICE', 'PROMO MIN PRICE', 'PROMO MAX PRICE']
+EMPTY_PRICE_CELLS = ['', '', '', '']
+
+""" kinds of per-adjustment warnings, repeated ones are summarized """
+COUNTRY_MISSING = 'country_missing'
+COUNTRY_DIFFERENT = 'country_different'
+SCHEDULE_MISSING = 'schedule_missing'
+PERIOD_MISSING = 'period_missing'
+DATES_DIFFERENT = 'dates_different'
 
 
 class PromoSheet(object):
     """
     Model of promo sheet
+    adjustments: adjustments of the sheet, all adjustments of generator by default
+    csv_name: name of output csv file, output_csv_file property by default
+    resolved_styles: style rows parts shared by sheets of one run
+    xls_name: name of output promo sheet, promo_sheet property by default
     """
 
-    def __init__(self, generator=None):
+    """ ItemPrice fields used by the sheet, the rest is not parsed in projection mode """
+    ITEM_PRICE_FIELDS = ('item_style_code',)
+
+    def __init__(self, generator=None, adjustments=None, csv_name=None, resolved_styles=None, xls_name=None):
         self.title = '{country} USA MARCIANO STORES (INCLUDES {year}) - {month} WEEK {week_number}'
+        self.unscheduled_title = '{country} USA MARCIANO STORES - NOT SCHEDULED'
         self.effective = 'Effective: {start_date}   {end_date}'
         self.country = ''
         self.start_date = ''
@@ -29,8 +54,21 @@ class PromoSheet(object):
              'DEPT', 'SUBDEPT', 'CLASS', 'POS?', 'DEPT', 'SUBDEPT', 'CLASS', 'NOTES','']
 
         self.generator = generator
+        self.adjustments = adjustments if adjustments is not None else \
+            (generator.adjustments if generator else [])
+        self.csv_name = csv_name
+        self.xls_name = xls_name
+        self.input_encoding = getattr(generator, 'input_encoding', DEFAULT_INPUT_ENCODING)
+
+        """ per-style price range columns of adjustments parsed in columnar mode """
+        self.row_width = len(self.columns)
+        self.price_columns = any(adjustment.item_columns is not None for adjustment in self.adjustments)
+        if self.price_columns:
+            self.columns = self.columns + PRICE_COLUMNS
 
         self.records = []
+        self.rows_count = 0
+        self._resolved_styles = resolved_styles if resolved_styles is not None else {}
 
         self.footer = ['*NEW PROMOTIONS AND ANY    CHANGES ARE BOLDED AND HIGHLIGHTED IN GREY']
 
@@ -39,61 +77,101 @@ class PromoSheet(object):
         Simplified promo sheet rows generation algorithm
         TODO: check adjustments items styles/colors processing
         """
-        ALL_COLLORS = 'ALL'
-        ALL_COLLORS_QUANTITY = 2
-        EMPTY_OTHER_INFO_ROW_PART = ['', '', '', '', '', '', '', '', '']
-
         if not self.generator:
             self.records = []
             return None
 
-        generator = self.generator
-
-        adjustments_list, color_map, other_info, marchandising_signage, logger =\
-            generator.adjustments, \
-            generator.color_map, \
-            generator.other_data, \
-            generator.marchandising_signage,  \
-            generator.logger
+        self.update_header()
+        self.records = list(self.iter_records())
 
-        result = []
-
-        for adjustment in adjustments_list:
-            # update country and period
+    def update_header(self):
+        """
+        Country and period of the sheet: a pass over adjustments only, rows are not formed
+        """
+        for adjustment in self.adjustments:
             self.update_country(adjustment)
             self.update_period(adjustment)
 
-            # process styles/colors
-            adjustment_item_styles = set(item_price.item_style_code for item_price in adjustment.item_price)
-            possible_styles = color_map.keys()
+    def iter_records(self):
+        """
+        Promo sheet rows one by one, nothing is accumulated
+        """
+        if not self.generator:
+            return
+
+        adjustments_list, marchandising_signage, new_adjustments = \
+            self.adjustments, self.generator.marchandising_signage, self.generator.new_adjustments
 
-            current_adjustment_styles = \
-                {style:  ([ALL_COLLORS, color_map.get_colors(style).values()[0][1]]
-                          if len(color_map.get_colors(style).values()) >= ALL_COLLORS_QUANTITY else
-                          list(color_map.get_colors(style).values()[0]))
-                 for style in adjustment_item_styles
-                 if style in possible_styles}
+        for adjustment in adjustments_list:
+            # process styles/colors
+            adjustment_item_styles = adjustment.item_styles()
+            category = adjustment.parameters['PromoCategory'].value
+            signage = marchandising_signage.get(adjustment.oid, EMPTY_MARCHANDISING_SIGNAGE)
+            row_type = HighlightedRow if adjustment.oid in new_adjustments else list
+            price_cells = self.price_cells(adjustment) if self.price_columns else None
 
             # form a data row for output
+            for style in adjustment_item_styles:
+                resolved_style = self.resolve_style(style)
+                if resolved_style:
+                    colors, other_info = resolved_style
+                    row = row_type([category, adjustment.header_description, style] + colors + signage + other_info)
+                    if price_cells is not None:
+                        row.extend([''] * (self.row_width - len(row)))
+                        row.extend(price_cells.get(style, EMPTY_PRICE_CELLS))
+                    yield row
+
+    def price_cells(self, adjustment):
+        """
+        Min and max price of every style of the adjustment over its item price lines,
+        and both of them after PromotionPct; aggregates of all styles are computed at once from the columns
+        """
+        columns = adjustment.item_columns
+        if columns is None:
+            return {}
+
+        promotion_parameter = adjustment.parameters.get('PromotionPct')
+        factor = promotion_factor(promotion_parameter.value if promotion_parameter else None)
+        price_cells = {}
+        for style, (minimum, maximum) in zip(columns.styles, columns.price_ranges()):
+            promo_minimum, promo_maximum = (minimum * factor, maximum * factor) if factor is not None else \
+                (None, None)
+            price_cells[style] = [format_price(minimum), format_price(maximum),
+                                  format_price(promo_minimum), format_price(promo_maximum)]
+        return price_cells
+
+    def resolve_style(self, style):
+        """
+        Color/description and other info parts of the style rows, built once per style for the whole sheet.
+        None for the style missing in color map
+        """
+        try:
+            return self._resolved_styles[style]
+        except KeyError:
+            pass
+
+        resolved_style = None
+        colors = self.generator.color_map.get_colors(style)
+        if colors:
+            variants = colors.values()
+            colors_part = [ALL_COLLORS, variants[0][1]] if len(variants) >= ALL_COLLORS_QUANTITY else \
+                list(variants[0])
+            resolved_style = colors_part, self.generator.other_data.get(style, EMPTY_OTHER_INFO_ROW_PART)[1:]
+
+        self._resolved_styles[style] = resolved_style
+        return resolved_style
 
-            a_row = [[adjustment.parameters['PromoCategory'].value,
-                      adjustment.header_description,
-                      style]
-                     + current_adjustment_styles[style]
-                     + marchandising_signage.get(adjustment.oid, '')
-                     + other_info.get(style, EMPTY_OTHER_INFO_ROW_PART)[1:]
-                     for style in adjustment_item_styles
-                     if style in possible_styles]
-            # append new data row
-            result.extend(a_row)
-        self.records = result
+    def missing_styles(self):
+        """styles of adjustments missing in color map"""
+        return [style for style, resolved_style in self._resolved_styles.items() if resolved_style is None]
 
     def update_country(self, adjustment):
         country_parameter = adjustment.parameters.get('Country')
         if not country_parameter:
             self.generator.logger.error(
                 "There are no country parameter in adjustment OID={0}. Used {1}".format(adjustment.oid,
-                                                                                        DEFAULT_COUNTRY))
+                                                                                        DEFAULT_COUNTRY),
+                extra=warning_extra(COUNTRY_MISSING, adjustment.oid))
             if not self.country:
                 self.country = DEFAULT_COUNTRY
                 self.generator.logger.info(
@@ -102,21 +180,24 @@ class PromoSheet(object):
 
             self.country = country_parameter.value
 
-        elif self.country is not country_parameter.value:
+        elif self.country != country_parameter.value:
             self.generator.logger.warning(
                 "Country value in adjustment OID={0} is diferent ({1})".format(adjustment.oid,
-                                                                               country_parameter.value))
+                                                                               country_parameter.value),
+                extra=warning_extra(COUNTRY_DIFFERENT, adjustment.oid))
 
     def update_period(self, adjustment):
         schedule = adjustment.schedule
 
         if not schedule:
-            self.generator.logger.warning("There are no schedule in adjustment OID={0}".format(adjustment.oid))
+            self.generator.logger.warning("There are no schedule in adjustment OID={0}".format(adjustment.oid),
+                                          extra=warning_extra(SCHEDULE_MISSING, adjustment.oid))
             return None
 
         if not schedule._start_date or not schedule._end_date:
             self.generator.logger.warning(
-                "The periond in adjustment schedule is not defined in adjustment OID={0}".format(adjustment.oid))
+                "The periond in adjustment schedule is not defined in adjustment OID={0}".format(adjustment.oid),
+                extra=warning_extra(PERIOD_MISSING, adjustment.oid))
         else:
             start, end = (schedule.start_date(self.country), schedule.end_date(self.country)) if self.country else \
                 (schedule.start_date(), schedule.end_date())
@@ -124,37 +205,94 @@ class PromoSheet(object):
                 self.start_date, self.end_date = start, end
             elif not ((self.start_date, self.end_date) == (start, end)):
                 self.generator.logger.warning(
-                    "The dates in schedule adjustment OID={0} are different".format(adjustment.oid))
+                    "The dates in schedule adjustment OID={0} are different".format(adjustment.oid),
+                    extra=warning_extra(DATES_DIFFERENT, adjustment.oid))
 
-    def export_csv(self):
-        """
-        Form csv model of prom sheet
-        """
+    def sheet_header(self):
+        """title, effective period and effective dates of the sheet"""
         export_date_format = "%m/%d/%Y"
-        csv_name = self.generator.configuration.get(PROPERTY_SECTION, "output_csv_file")
-        csv_path = os.path.join(self.generator.output_dir, csv_name)
 
-        self.generator.logger.info("Writing CSV file: {0}".format(csv_path))
-        with open(csv_path, WRITE_FILE_OPTION) as csv_file:
+        if self.start_date:
             # {country} USA MARCIANO STORES (INCLUDES {year}) - {month} WEEK {week_number}
-
             date = datetime.datetime.strptime(self.start_date, export_date_format)
             year, week_number, day = date.isocalendar()
 
             title = self.title.format(country=self.country, year=year,
                                       month=calendar.month_name[date.month], week_number=week_number)
-            effective_period = self.effective.format(start_date=self.start_date, end_date=self.end_date)
+        else:
+            # sheet of adjustments without schedule, one partition of partitioned export
+            title = self.unscheduled_title.format(country=self.country)
+        effective_period = self.effective.format(start_date=self.start_date, end_date=self.end_date)
+
+        # PROMO SHEET EFFECTIVE {start_date} {end_date}
+        effective_dates = self.header_promo_effective.format(start_date=self.start_date, end_date=self.end_date)
+        return title, effective_period, effective_dates
 
-            # PROMO SHEET EFFECTIVE {start_date} {end_date}
-            effective_dates = [self.header_promo_effective.format(start_date=self.start_date, end_date=self.end_date)]
-            all_rows = [[title, effective_period], effective_dates + self.headers, self.columns]
-            all_rows.extend(self.records)
-            all_rows.extend([self.footer])
-            writer = csv.writer(csv_file, dialect=csv.excel, delimiter=OUTPUT_DELIMITER)
-            [writer.writerow(row) for row in all_rows]
+    def export_csv(self, records=None):
+        """
+        Form csv model of prom sheet
+        records: rows iterable written as they come, formed records by default
+        """
+        self.export(records, to_xls=False)
 
-    def export_xls(self):
+    def export_xls(self, records=None):
         """
         Form prom sheet
+        records: rows iterable written as they come, formed records by default
         """
-        pass
+        self.export(records, to_csv=False)
+
+    def export(self, records=None, to_csv=True, to_xls=True):
+        """
+        Write csv model and promo sheet from one pass over records
+        """
+        configuration = self.generator.configuration
+        header = self.sheet_header()
+
+        writers = []
+        try:
+            if to_csv:
+                csv_name = self.csv_name or configuration.get(PROPERTY_SECTION, "output_csv_file")
+                csv_path = os.path.join(self.generator.output_dir, csv_name)
+                self.generator.logger.info("Writing CSV file: {0}".format(csv_path))
+                writers.append(CsvSheetWriter(csv_path))
+            if to_xls:
+                xls_name = self.xls_name or configuration.get(PROPERTY_SECTION, "promo_sheet")
+                xls_path = os.path.join(self.generator.output_dir, xls_name)
+                self.generator.logger.info("Writing XLS file: {0}".format(xls_path))
+                writers.append(XlsSheetWriter(xls_path, input_encoding=self.input_encoding))
+
+            self.write(writers, header, records)
+        finally:
+            for writer in writers:
+                writer.close()
+
+    def write(self, writers, header, records=None):
+        """one pass over records to all writers, header is (title, effective period, effective dates)"""
+        title, effective_period, effective_dates = header
+        for writer in writers:
+            writer.write_header(title, effective_period, effective_dates, self.headers, self.columns)
+        self.rows_count = 0
+        for row in (self.records if records is None else records):
+            for writer in writers:
+                writer.write_row(row)
+            self.rows_count += 1
+        for writer in writers:
+            writer.write_footer(self.footer)
+
+    def render(self, output_format=CSV_FORMAT):
+        """
+        Promo sheet document in memory, rows are formed while they are written
+        output_format: csv or xls
+        """
+        self.update_header()
+        header = self.sheet_header()
+
+        output = cStringIO.StringIO()
+        if output_format == XLS_FORMAT:
+            writer = XlsSheetWriter(output, input_encoding=self.input_encoding)
+        else:
+            writer = CsvSheetWriter(output)
+        self.write([writer], header, self.iter_records())
+        writer.close()
+        return output.getvalue()
@@ -1,37 +1,101 @@
 """
 Groups the aggregate of adjustments by event field into promo sheet and into CSV file
 """
+import collections
+import cProfile
 import glob
+import hashlib
+import itertools
 import logging
+import multiprocessing
 import os
+import re
 import sys
 import ConfigParser
 
-from app.adjustment import Adjustment
+from app.adjustment import read_adjustments
 from app.color_map import ColorMap
-from app.promo_sheet import PromoSheet
+from app.concurrent_loading import load_concurrently
+from app.incremental_store import IncrementalStore
+from app.input_files import is_compressed, open_input
+from app.log_pipeline import WarningAggregator, flush_logs, shared_log_handler
+from app.lookup_index import IndexedLookup
+from app.metrics import RunMetrics
+from app.overlaps import ITEM_PRICE_FIELDS as OVERLAP_ITEM_PRICE_FIELDS, find_overlaps, write_overlap_report
+from app.promo_sheet import PromoSheet, DEFAULT_COUNTRY
+from app.sheet_writers import DEFAULT_INPUT_ENCODING
+from app.service import PromoService
+from app.watcher import PromoWatcher
 
 PROPERTY_FILE = '/home/georgeg/work/guess_promo_sheet/properties/Guess.properties'
 PROPERTY_SECTION = 'PROMO_SHEET'
-READ_FILE_OPTION = 'r'
 INPUT_DELIMITER = '|'
+ADJUSTMENT_LOGGER = 'adjustment'
+EVENT_FILE_NAME_SEPARATOR = '_'
+""" file name part of an empty partition value """
+PARTITION_NO_VALUE = 'none'
+""" length of the hash of event or partition added to file names that are the same for several sheets """
+SHEET_KEY_HASH_LENGTH = 8
+SHEET_KEY_SEPARATOR = '\t'
+
+""" generator of batch run, inherited by forked workers of event sheets pool """
+_batch_generator = None
+
+
+def load_adjustment_file(arguments):
+    """process pool task: all adjustments of the event from one adjustment file"""
+    path, event, item_fields, item_columns = arguments
+    with open_input(path) as adjustment_file:
+        return list(read_adjustments(adjustment_file, event, logging.getLogger(ADJUSTMENT_LOGGER), item_fields,
+                                     item_columns))
+
+
+def form_event_promo_sheet(event):
+    """
+    process pool task: promo sheet of one event of the batch generator,
+    its rows count, missing styles and counted warnings
+    """
+    promoSheet = _batch_generator.form_event_promo_sheet(event)
+    return promoSheet.rows_count, promoSheet.missing_styles(), _batch_generator.warnings.drain()
+
+
+def form_partition_promo_sheet(partition):
+    """process pool task: promo sheet of one partition, as form_event_promo_sheet"""
+    promoSheet = _batch_generator.form_partition_promo_sheet(partition)
+    return promoSheet.rows_count, promoSheet.missing_styles(), _batch_generator.warnings.drain()
+
 
 class PromoGenerator(object):
     """
     Main class for gene
     """
 
-    def __init__(self, property_file):
+    def __init__(self, property_file, upload_lookup=True):
         self.adjustments = []
+        self.events = collections.OrderedDict()
+        self.partitions = collections.OrderedDict()
+        self.sheet_names = {}
+        self.resolved_styles = {}
+        self.new_adjustments = set()
+        self.missing_styles = set()
         self.logger = None
+        self.warnings = None
 
-        self.configuration = self.upload_configuration(property_file)
-        self.logger = self.init_logger(self.configuration, 'generator')
-        self.adjustments_logger = self.init_logger(self.configuration, 'adjustment')
+        self.metrics = RunMetrics()
+        with self.metrics.stage("configuration"):
+            self.configuration = self.upload_configuration(property_file)
+            self.logger = self.init_logger(self.configuration, 'generator')
+            self.adjustments_logger = self.init_logger(self.configuration, ADJUSTMENT_LOGGER)
 
         self.input_dir = self.configuration.get(PROPERTY_SECTION, "input_dir")
         self.output_dir = self.configuration.get(PROPERTY_SECTION, "output_dir")
 
+        """ optional cProfile of the run, stats are written to profile_file in output directory """
+        self.profiler = None
+        if self.get_option("profile_file"):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
         """
         format: pipe delimited file; key: style_code
         field names: style_code,
@@ -39,20 +103,51 @@ class PromoGenerator(object):
             POS_Incslusions, Department_Exclusions, SubDepartment_Exclusions, Class_Exclusions,
             Notes_Exclusions
         """
-        other_data_file = os.path.join(self.input_dir, self.configuration.get(PROPERTY_SECTION, "other_info"))
+        self.other_data_file = os.path.join(self.input_dir, self.configuration.get(PROPERTY_SECTION, "other_info"))
         """
         format: pipe delimited file; key: adjustment_oid
         field names: adjustment_oid, marchandising_signage
         """
-        merchandising_file = os.path.join(self.input_dir,
-                                          self.configuration.get(PROPERTY_SECTION, "marchandising_info"))
+        self.merchandising_file = os.path.join(self.input_dir,
+                                               self.configuration.get(PROPERTY_SECTION, "marchandising_info"))
+
+        """ encoding of input files, text of XLS promo sheet is decoded with it """
+        self.input_encoding = self.get_option("input_encoding", DEFAULT_INPUT_ENCODING)
 
         """ color map from item info """
-        item_info_template = self.configuration.get(PROPERTY_SECTION, "item_info")
+        self.item_info_template = self.configuration.get(PROPERTY_SECTION, "item_info")
+
+        self.other_data = None
+        self.marchandising_signage = None
+        self.color_map = None
+
+        """ projection mode: only ItemPrice fields used by promo sheet and by overlap report are parsed """
+        self.item_fields = None
+        if self.get_flag("item_price_projection"):
+            self.item_fields = PromoSheet.ITEM_PRICE_FIELDS
+            if self.get_option("overlap_report"):
+                self.item_fields += OVERLAP_ITEM_PRICE_FIELDS
+
+        """ columnar mode: item prices are parsed into columns, sheets get per-style price range columns """
+        self.item_price_columns = self.get_flag("item_price_columns")
+
+        """ batch mode: adjustments of all events are loaded, a promo sheet is formed for every event """
+        self.batch_mode = self.get_flag("batch_mode")
 
-        self.other_data = self.upload_other_data(other_data_file)
-        self.marchandising_signage = self.upload_other_data(merchandising_file)
-        self.color_map = ColorMap(self.logger, self.input_dir, item_info_template)
+        """ partitioned mode: a promo sheet per country, promo category and schedule period (of every event) """
+        self.partitioned_export = self.get_flag("partitioned_export")
+
+        """ incremental mode: parsed input files are reused while they are not changed """
+        store_dir = self.get_option("incremental_store_dir")
+        self.incremental_store = IncrementalStore(store_dir, self.logger) if store_dir else None
+
+        """ two-phase mode: lookup data is loaded after adjustments, only for the styles they reference """
+        self.referenced_styles_only = self.get_flag("referenced_styles_only")
+
+        """ concurrent mode: independent inputs are loaded at once, lookup data together with adjustments """
+        self.concurrent_loading = self.get_flag("concurrent_loading")
+        if upload_lookup and not self.referenced_styles_only and not self.concurrent_loading:
+            self.upload_lookup_data()
 
     def upload_configuration(self, property_file):
         configuration = ConfigParser.ConfigParser()
@@ -74,42 +169,168 @@ class PromoGenerator(object):
 
         handler_file = os.path.join(path, filename)
 
-        file_handler = logging.FileHandler(handler_file)
-
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
+        # loggers of the log file share one handler, whatever number of times they are initialized
+        asynchronous = self.get_flag("async_logging")
+        handler = shared_log_handler(handler_file, asynchronous)
 
         logger = logging.getLogger(name)
-        logger.addHandler(file_handler)
+        if handler not in logger.handlers:
+            logger.addHandler(handler)
+        # asynchronous handler writes to the console itself
+        logger.propagate = not asynchronous
+
+        """ repeated per-adjustment warnings are summarized at the end of the run """
+        for log_filter in [log_filter for log_filter in logger.filters if isinstance(log_filter, WarningAggregator)]:
+            logger.removeFilter(log_filter)
+        if self.warnings is None:
+            self.warnings = WarningAggregator(float(self.get_option("log_sample_rate", 1)))
+        logger.addFilter(self.warnings)
 
         return logger
 
+    def get_option(self, name, default=None):
+        """optional property, default is used when it is not set in property file"""
+        if not self.configuration.has_option(PROPERTY_SECTION, name):
+            return default
+        return self.configuration.get(PROPERTY_SECTION, name)
+
+    def get_flag(self, name):
+        """optional boolean property, false when it is not set in property file"""
+        if not self.configuration.has_option(PROPERTY_SECTION, name):
+            return False
+        return self.configuration.getboolean(PROPERTY_SECTION, name)
+
+    def upload_lookup_data(self, styles=None, oids=None):
+        """
+        Other data, merchandising signage and color map.
+        styles and oids limit the loaded rows to the style codes and adjustments OIDs in use
+        """
+        self.other_data, self.marchandising_signage, self.color_map = self.load_lookup_data(styles, oids)
+
+    def load_lookup_data(self, styles=None, oids=None):
+        """other data, merchandising signage and color map without replacing the loaded ones"""
+        return tuple(self.load_inputs(self.lookup_tasks(styles, oids)))
+
+    def lookup_tasks(self, styles=None, oids=None):
+        """(input name, loader of a logger) of other data, merchandising signage and color map"""
+        def load_other_data(logger):
+            with self.metrics.stage("other_data"):
+                return self.upload_other_data(self.other_data_file, styles, logger)
+
+        def load_merchandising(logger):
+            with self.metrics.stage("merchandising"):
+                return self.upload_other_data(self.merchandising_file, oids, logger)
+
+        return [(self.other_data_file, load_other_data),
+                (self.merchandising_file, load_merchandising),
+                (self.item_info_template, lambda logger: self.load_color_map(styles, logger))]
+
+    def load_inputs(self, tasks):
+        """
+        Results of (input name, loader of a logger) tasks in their order.
+        In concurrent mode they are loaded at once, the log is written as if they were loaded one by one
+        """
+        if self.concurrent_loading and len(tasks) > 1:
+            return load_concurrently(tasks, self.logger)
+        return [loader(self.logger) for name, loader in tasks]
+
+    def upload_color_map(self, styles=None):
+        self.color_map = self.load_color_map(styles)
+
+    def load_color_map(self, styles=None, logger=None):
+        color_map_cache_dir = self.get_option("color_map_cache_dir")
+        with self.metrics.stage("color_map"):
+            return ColorMap(logger or self.logger, self.input_dir, self.item_info_template, color_map_cache_dir,
+                            styles)
+
     def upload_adjustments(self):
 
         path_to_files = self.configuration.get(PROPERTY_SECTION, "input_dir")
         filename = self.configuration.get(PROPERTY_SECTION, "adjustments_files")
-        adjustments = glob.iglob(os.path.join(path_to_files, filename))
+        adjustment_files = glob.glob(os.path.join(path_to_files, filename))
+        adjustment_event = None if self.batch_mode else self.configuration.get(PROPERTY_SECTION, "event_name")
+        store = self.incremental_store
+        parameters = adjustment_event, self.item_fields, self.item_price_columns
+
+        with self.metrics.stage("adjustments"):
+            adjustments_by_file = {}
+            if store:
+                for path in adjustment_files:
+                    stored_adjustments = store.load(path, parameters)
+                    if stored_adjustments is not None:
+                        adjustments_by_file[path] = stored_adjustments
+
+            changed_files = [path for path in adjustment_files if path not in adjustments_by_file]
+            if self.concurrent_loading and self.color_map is None and not self.referenced_styles_only:
+                # lookup data is loaded while adjustment files are parsed
+                tasks = self.lookup_tasks() + [
+                    (filename, lambda logger: list(self.parse_adjustment_files(changed_files, adjustment_event,
+                                                                               logger)))]
+                results = self.load_inputs(tasks)
+                self.other_data, self.marchandising_signage, self.color_map = results[:-1]
+                parsed_adjustments = results[-1]
+            else:
+                parsed_adjustments = self.parse_adjustment_files(changed_files, adjustment_event)
+            for path, adjustments in itertools.izip(changed_files, parsed_adjustments):
+                adjustments_by_file[path] = adjustments
+                self.count_parsed_lines(adjustments)
+                if store:
+                    store.save(path, adjustments, parameters)
+                    # without the store, or with a new one, every adjustment is new: only changes are highlighted
+                    if not store.cold:
+                        self.new_adjustments.update(adjustment.oid for adjustment in adjustments)
+
+            # adjustments are taken in the order of files whatever way they were loaded
+            for path in adjustment_files:
+                for adjustment in adjustments_by_file.pop(path):
+                    self.logger.info("Loading of adjustment OID={0}".format(adjustment.oid))
+                    self.adjustments.append(adjustment)
+
+        if self.referenced_styles_only:
+            styles = set(style for adjustment in self.adjustments for style in adjustment.item_styles())
+            oids = set(adjustment.oid for adjustment in self.adjustments)
+            self.logger.info("Loading lookup data for {0} referenced styles".format(len(styles)))
+            self.upload_lookup_data(styles, oids)
+
+        if store:
+            store.commit()
+
+    def parse_adjustment_files(self, adjustment_files, adjustment_event, logger=None, parallel=True):
+        """
+        Adjustments of every file in the order of adjustment_files.
+        With parallel workers files are parsed in a process pool, unless parallel is false
+        """
+        logger = logger or self.logger
+        workers = int(self.get_option("parallel_workers", 0)) if parallel else 0
+        if workers <= 1 or len(adjustment_files) <= 1:
+            for path in adjustment_files:
+                yield load_adjustment_file((path, adjustment_event, self.item_fields, self.item_price_columns))
+            return
+
+        chunk_size = int(self.get_option("parallel_chunk_size", 1))
+        logger.info("Loading {0} adjustment files with {1} workers".format(len(adjustment_files), workers))
+
+        pool = multiprocessing.Pool(workers)
+        try:
+            tasks = itertools.izip(adjustment_files, itertools.repeat(adjustment_event),
+                                   itertools.repeat(self.item_fields), itertools.repeat(self.item_price_columns))
+            for adjustments in pool.imap(load_adjustment_file, tasks, chunk_size):
+                yield adjustments
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
 
+    def count_parsed_lines(self, adjustments):
+        """lines of parsed adjustments by line type, adjustments reused from the store are not counted"""
         for adjustment in adjustments:
-            with open(adjustment, READ_FILE_OPTION) as adjustment_file:
-                adjustment_event = self.configuration.get(PROPERTY_SECTION, "event_name")
-                self._process_adjustment_file(adjustment_file, adjustment_event)
-
-    def _process_adjustment_file(self, adjustment_file, adjustment_event):
-        header_line_letter = 'A'
-        for line in adjustment_file:
-            fields = line.split(INPUT_DELIMITER)
-            line_type = fields[0].strip()
-
-            is_header_with_adjustment_event = line_type == header_line_letter and fields[4].strip() == adjustment_event
+            for line_type, count in sorted(adjustment.line_counts.items()):
+                self.metrics.count("lines_parsed", count, type=line_type)
 
-            if is_header_with_adjustment_event:
-                adjustment_file.seek(0)
-                self.logger.info("Loading of adjustment OID={0}".format(fields[1].strip()))
-                self.adjustments.append(Adjustment(adjustment_file, self.adjustments_logger))
-                break
-
-    def upload_other_data(self, other_item_info):
+    def upload_other_data(self, other_item_info, keys=None, logger=None):
         """
         Upload other data from temporary unknown sources
         format: pipe delimited file; key: style_code
@@ -117,20 +338,253 @@ class PromoGenerator(object):
             Category, Department_Inclusions, SubDepartment_Inclusions, Class_Inclusions,
             POS_Incslusions, Department_Exclusions, SubDepartment_Exclusions, Class_Exclusions,
             Notes_Exclusions
+        keys: when given, only rows with these keys are kept
+        logger: logger of the loading, logger of generator by default
+        With lookup index directory the file is not loaded, rows are read from it by an index as they are looked up
         """
-        other_data = {}
-        with open(other_item_info, READ_FILE_OPTION) as item_info_file:
-            lines = [line.rstrip().split(INPUT_DELIMITER) for line in item_info_file]
-            other_data = dict((row[0], row[1:]) for row in lines)
-        self.logger.info("Additional data loaded: {0}".format(other_item_info))
+        logger = logger or self.logger
+        index_dir = self.get_option("lookup_index_dir")
+        if index_dir and is_compressed(other_item_info):
+            # rows of compressed file can not be read by offsets, it is loaded
+            logger.info("Compressed file is not indexed: {0}".format(other_item_info))
+        elif index_dir:
+            other_data = IndexedLookup(other_item_info, index_dir, int(self.get_option("lookup_cache_size", 0)))
+            logger.info("Additional data indexed: {0}, {1} keys{2}".format(
+                other_item_info, len(other_data), ", index rebuilt" if other_data.rebuilt else ""))
+            return other_data
+
+        # only complete data is kept in incremental store
+        store = self.incremental_store if keys is None else None
+
+        other_data = store.load(other_item_info) if store else None
+        if other_data is None:
+            other_data = {}
+            with open_input(other_item_info) as item_info_file:
+                for line in item_info_file:
+                    row = line.rstrip().split(INPUT_DELIMITER)
+                    if keys is None or row[0] in keys:
+                        other_data[row[0]] = row[1:]
+            if store:
+                store.save(other_item_info, other_data)
+        logger.info("Additional data loaded: {0}".format(other_item_info))
         return other_data
 
     def form_promo_sheet(self):
+        if self.partitioned_export:
+            self.form_partition_promo_sheets()
+            return None
+
+        if self.batch_mode:
+            self.form_event_promo_sheets()
+            return None
+
+        promoSheet = PromoSheet(self, resolved_styles=self.resolved_styles)
+        self.export_promo_sheet(promoSheet)
+
+    def export_promo_sheet(self, promoSheet):
+        if self.get_flag("streaming_export"):
+            # records are formed while they are exported
+            with self.metrics.stage("export"):
+                promoSheet.update_header()
+                promoSheet.export(promoSheet.iter_records())
+        else:
+            with self.metrics.stage("records"):
+                promoSheet.form_records()
+            with self.metrics.stage("export"):
+                promoSheet.export()
+        self.metrics.count("rows_emitted", promoSheet.rows_count)
+        self.missing_styles.update(promoSheet.missing_styles())
+
+    def group_events(self):
+        """adjustments by event of their header, events in the order of loading"""
+        events = collections.OrderedDict()
+        for adjustment in self.adjustments:
+            events.setdefault(adjustment.event, []).append(adjustment)
+        return events
+
+    def partition_key(self, adjustment):
+        """(event in batch mode,) country, promo category, start and end dates of the adjustment"""
+        country = adjustment.parameters.get('Country')
+        category = adjustment.parameters.get('PromoCategory')
+        schedule = adjustment.schedule
+        key = (adjustment.event,) if self.batch_mode else ()
+        key += (country.value if country else DEFAULT_COUNTRY, category.value if category else '')
+        """ parsed dates, so that 2016-9-1 and 2016-09-01 are the same partition """
+        return key + ((schedule.start_date(), schedule.end_date()) if schedule else ('', ''))
+
+    def group_partitions(self):
+        """adjustments by partition key, partitions in the order of loading"""
+        partitions = collections.OrderedDict()
+        for adjustment in self.adjustments:
+            partitions.setdefault(self.partition_key(adjustment), []).append(adjustment)
+        return partitions
+
+    def event_file_name(self, property_name, event):
+        return self.sheet_file_name(property_name, self.sheet_name(event))
+
+    def sheet_file_name(self, property_name, sheet_name):
+        """output file name of the property with the sheet name of event or partition added"""
+        name, extension = os.path.splitext(self.configuration.get(PROPERTY_SECTION, property_name))
+        return name + EVENT_FILE_NAME_SEPARATOR + sheet_name + extension
+
+    def sheet_name(self, key):
+        """file name part of event or partition key, the same for keys that differ only in non-word characters"""
+        parts = (key,) if isinstance(key, basestring) else key
+        return EVENT_FILE_NAME_SEPARATOR.join(
+            re.sub(r'\W+', EVENT_FILE_NAME_SEPARATOR, part).strip(EVENT_FILE_NAME_SEPARATOR) or PARTITION_NO_VALUE
+            for part in parts)
+
+    def unique_sheet_names(self, keys):
+        """
+        File name parts of the keys. Keys with the same name (letter case is ignored for case-insensitive file systems)
+        get a hash of their raw values added, so no sheet overwrites another one
+        """
+        names = collections.OrderedDict((key, self.sheet_name(key)) for key in keys)
+        counts = collections.Counter(name.lower() for name in names.values())
+        for key, name in names.items():
+            if counts[name.lower()] > 1:
+                parts = (key,) if isinstance(key, basestring) else key
+                key_hash = hashlib.sha1(SHEET_KEY_SEPARATOR.join(parts)).hexdigest()[:SHEET_KEY_HASH_LENGTH]
+                names[key] = name + EVENT_FILE_NAME_SEPARATOR + key_hash
+
+        counts = collections.Counter(name.lower() for name in names.values())
+        duplicates = sorted(name for name, count in counts.items() if count > 1)
+        if duplicates:
+            raise Exception("Promo sheets have the same file names: {0}".format(", ".join(duplicates)))
+        return names
+
+    def update_sheet_names(self, keys):
+        """
+        Sheet names of all current events or partitions. Sheet files of the keys that are gone, or named
+        differently now, are removed; keys with changed names are returned, their sheets are written again
+        """
+        names, old_names = self.unique_sheet_names(keys), self.sheet_names
+        self.sheet_names = names
+        for key, name in old_names.items():
+            if names.get(key) != name:
+                self.remove_sheet_files(name)
+        return set(key for key, name in names.items() if key in old_names and old_names[key] != name)
+
+    def remove_sheet_files(self, sheet_name):
+        for property_name in ("output_csv_file", "promo_sheet"):
+            path = os.path.join(self.output_dir, self.sheet_file_name(property_name, sheet_name))
+            if os.path.isfile(path):
+                os.remove(path)
+                self.logger.info("Promo sheet removed: {0}".format(path))
+
+    def sheet_file_names(self, key):
+        """(csv name, xls name) of the sheet of event or partition"""
+        sheet_name = self.sheet_names.get(key) or self.sheet_name(key)
+        return self.sheet_file_name("output_csv_file", sheet_name), self.sheet_file_name("promo_sheet", sheet_name)
+
+    def form_event_promo_sheet(self, event):
+        csv_name, xls_name = self.sheet_file_names(event)
+        self.logger.info("Forming promo sheet of event {0}".format(event))
+        promoSheet = PromoSheet(self, self.events[event], csv_name, self.resolved_styles, xls_name)
+        self.export_promo_sheet(promoSheet)
+        return promoSheet
+
+    def form_partition_promo_sheet(self, partition):
+        csv_name, xls_name = self.sheet_file_names(partition)
+        self.logger.info("Forming promo sheet of partition {0}".format(" / ".join(partition)))
+        promoSheet = PromoSheet(self, self.partitions[partition], csv_name, self.resolved_styles, xls_name)
+        self.export_promo_sheet(promoSheet)
+        return promoSheet
+
+    def form_event_promo_sheets(self, events=None):
+        """
+        One promo sheet per event from lookup data loaded once, only sheets of the events when they are given
+        """
+        self.events = self.group_events()
+        renamed = self.update_sheet_names(self.events.keys())
+        events = [event for event in self.events if events is None or event in events or event in renamed]
+        self.form_promo_sheets(events, self.form_event_promo_sheet, form_event_promo_sheet)
+
+    def form_partition_promo_sheets(self, events=None):
+        """
+        One promo sheet per partition, only partitions of the events when they are given in batch mode
+        """
+        self.partitions = self.group_partitions()
+        renamed = self.update_sheet_names(self.partitions.keys())
+        partitions = [partition for partition in self.partitions
+                      if events is None or not self.batch_mode or partition[0] in events or partition in renamed]
+        self.form_promo_sheets(partitions, self.form_partition_promo_sheet, form_partition_promo_sheet)
 
-        promoSheet = PromoSheet(self)
-        promoSheet.form_records()
-        promoSheet.export_csv()
-        promoSheet.export_xls()
+    def form_promo_sheets(self, keys, form_sheet, pool_task):
+        """
+        Promo sheets of the keys formed by form_sheet.
+        With parallel workers sheets are formed by pool_task in forked processes sharing the loaded data
+        """
+        global _batch_generator
+
+        workers = int(self.get_option("parallel_workers", 0))
+        if workers <= 1 or len(keys) <= 1:
+            for key in keys:
+                form_sheet(key)
+            return None
+
+        _batch_generator = self
+        # workers are forked without the warnings counted so far, they return only their own ones
+        counted_warnings = self.warnings.drain()
+        pool = multiprocessing.Pool(workers)
+        self.warnings.merge(counted_warnings)
+        try:
+            with self.metrics.stage("export"):
+                for rows_count, missing_styles, warnings in pool.imap(pool_task, keys):
+                    self.metrics.count("rows_emitted", rows_count)
+                    self.missing_styles.update(missing_styles)
+                    self.warnings.merge(warnings)
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+            _batch_generator = None
+
+    def report_overlaps(self):
+        """
+        Promotions overlapping on the same style over all loaded adjustments, the report is written next to promo CSV
+        """
+        report_file = self.get_option("overlap_report")
+        if not report_file:
+            return None
+
+        report_path = os.path.join(self.output_dir, report_file)
+        with self.metrics.stage("overlaps"):
+            conflicts = find_overlaps(self.adjustments)
+            write_overlap_report(report_path, conflicts)
+        self.metrics.count("overlap_conflicts", len(conflicts))
+        if conflicts:
+            self.logger.warning("Promotions overlap on {0} styles, see {1}".format(
+                len(set(conflict[0] for conflict in conflicts)), report_path))
+        else:
+            self.logger.info("There are no overlapping promotions: {0}".format(report_path))
+
+    def finish(self):
+        """
+        Run counters, metrics file and profile stats
+        """
+        self.metrics.count("adjustments_loaded", len(self.adjustments))
+        self.metrics.count("colors_filtered", self.color_map.filter_counter if self.color_map else 0)
+        self.metrics.count("styles_missing", len(self.missing_styles))
+        for kind, warnings in self.warnings.kinds.items():
+            self.metrics.count("warnings", warnings.count, kind=kind)
+        self.warnings.log_summary(self.logger)
+
+        if self.profiler:
+            self.profiler.disable()
+            profile_path = os.path.join(self.output_dir, self.get_option("profile_file"))
+            self.profiler.dump_stats(profile_path)
+            self.logger.info("Profile stats written: {0}".format(profile_path))
+
+        metrics_file = self.get_option("metrics_file")
+        if metrics_file:
+            metrics_path = os.path.join(self.output_dir, metrics_file)
+            self.metrics.write(metrics_path)
+            self.logger.info("Metrics written: {0}".format(metrics_path))
+        flush_logs()
 
 if __name__ == '__main__':
 
@@ -150,8 +604,20 @@ if __name__ == '__main__':
 
     try:
         promoGenerator = PromoGenerator(property_file)
-        promoGenerator.upload_adjustments()
-        promoGenerator.form_promo_sheet()
+        watch_interval = float(promoGenerator.get_option("watch_interval", 0))
+        service_port = int(promoGenerator.get_option("service_port", 0))
+        if service_port:
+            service_address = promoGenerator.get_option("service_host", "127.0.0.1"), service_port
+            PromoService(promoGenerator, service_address, int(promoGenerator.get_option("service_threads", 4)),
+                         int(promoGenerator.get_option("service_cache_size", 16)),
+                         float(promoGenerator.get_option("service_poll_interval", 5))).run()
+        elif watch_interval:
+            PromoWatcher(promoGenerator, watch_interval).run()
+        else:
+            promoGenerator.upload_adjustments()
+            promoGenerator.form_promo_sheet()
+            promoGenerator.report_overlaps()
+        promoGenerator.finish()
     except:
         if promoGenerator and promoGenerator.logger:
             promoGenerator.logger.error("Error in processing file {0}".format(sys.exc_value))
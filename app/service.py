@@ -0,0 +1,351 @@
+"""
+Service mode: promo sheets are rendered on request over HTTP, lookup data is loaded once and shared by requests
+"""
+import BaseHTTPServer
+import collections
+import datetime
+import json
+import Queue
+import SocketServer
+import threading
+import time
+import urlparse
+
+from app.adjustment import AdjustmentSchedule
+from app.promo_sheet import PromoSheet, CSV_FORMAT, XLS_FORMAT
+from app.watcher import PromoWatcher
+
+PROPERTY_SECTION = 'PROMO_SHEET'
+CONTENT_TYPES = {
+    CSV_FORMAT: 'text/tab-separated-values',
+    XLS_FORMAT: 'application/vnd.ms-excel'
+}
+JSON_CONTENT_TYPE = 'application/json'
+SHEET_FILE_PROPERTIES = {
+    CSV_FORMAT: 'output_csv_file',
+    XLS_FORMAT: 'promo_sheet'
+}
+""" latencies of the last requests the percentiles are computed from """
+LATENCY_WINDOW = 1000
+LATENCY_PERCENTILES = (50, 90, 99)
+DEFAULT_POLL_INTERVAL = 5
+
+
+class RequestError(Exception):
+    """request that can not be served, status is the HTTP status of the response"""
+
+    def __init__(self, status, message):
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+
+class SheetSource(object):
+    """
+    Lookup data and adjustments of one state of input files, sheets are rendered from it.
+    A new source replaces the old one when input files are changed, requests in progress keep the old one
+    """
+
+    def __init__(self, generator, adjustments, fingerprint):
+        self.logger = generator.logger
+        self.other_data = generator.other_data
+        self.marchandising_signage = generator.marchandising_signage
+        self.color_map = generator.color_map
+        self.new_adjustments = frozenset(generator.new_adjustments)
+        self.input_encoding = generator.input_encoding
+        self.adjustments = adjustments
+        self.fingerprint = fingerprint
+        self.resolved_styles = {}
+
+    def select(self, event=None, start=None, end=None):
+        """adjustments of the event with schedule overlapping start - end period, the given conditions only"""
+        adjustments = []
+        for adjustment in self.adjustments:
+            if event is not None and adjustment.event != event:
+                continue
+            if start is not None or end is not None:
+                schedule = adjustment.schedule
+                if not schedule or not schedule._start_date or not schedule._end_date:
+                    continue
+                if (end is not None and schedule._start_date > end) or \
+                        (start is not None and schedule._end_date < start):
+                    continue
+            adjustments.append(adjustment)
+        return adjustments
+
+
+class SheetCache(object):
+    """
+    Rendered sheets with least recently used eviction
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.sheets = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            sheet = self.sheets.pop(key, None)
+            if sheet is not None:
+                self.sheets[key] = sheet
+            return sheet
+
+    def put(self, key, sheet):
+        if self.size <= 0:
+            return None
+        with self.lock:
+            self.sheets.pop(key, None)
+            self.sheets[key] = sheet
+            while len(self.sheets) > self.size:
+                self.sheets.popitem(last=False)
+
+    def __len__(self):
+        return len(self.sheets)
+
+
+class ServiceStats(object):
+    """
+    Request counters, cache hit rate and latency percentiles of the service
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.statuses = collections.defaultdict(int)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, status, latency, cache_hit=None):
+        with self.lock:
+            self.requests += 1
+            self.statuses[status] += 1
+            self.latencies.append(latency)
+            if cache_hit is not None:
+                if cache_hit:
+                    self.cache_hits += 1
+                else:
+                    self.cache_misses += 1
+
+    def report(self, cache):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            lookups = self.cache_hits + self.cache_misses
+            report = {
+                "uptime_seconds": round(time.time() - self.started, 3),
+                "requests": self.requests,
+                "statuses": dict((str(status), count) for status, count in self.statuses.items()),
+                "cache": {
+                    "hits": self.cache_hits,
+                    "misses": self.cache_misses,
+                    "hit_rate": round(float(self.cache_hits) / lookups, 4) if lookups else None,
+                    "sheets": len(cache),
+                    "size": cache.size
+                }
+            }
+        latency_report = dict(("p{0}".format(percentile), percentile_ms(latencies, percentile))
+                              for percentile in LATENCY_PERCENTILES)
+        latency_report["max"] = round(latencies[-1] * 1000, 3) if latencies else None
+        latency_report["samples"] = len(latencies)
+        report["latency_ms"] = latency_report
+        return report
+
+
+def percentile_ms(latencies, percentile):
+    """nearest rank percentile of sorted latencies in milliseconds"""
+    if not latencies:
+        return None
+    rank = max(int(round(percentile / 100.0 * len(latencies))), 1)
+    return round(latencies[rank - 1] * 1000, 3)
+
+
+class PromoRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    GET /sheet?event=<event>&format=<csv|xls> or /sheet?start=<YYYY-MM-DD>&end=<YYYY-MM-DD>&format=<csv|xls>,
+    event and period may be combined; GET /stats
+    """
+
+    def do_GET(self):
+        service = self.server.service
+        started = time.time()
+        cache_hit = None
+        url = urlparse.urlparse(self.path)
+        try:
+            if url.path == '/stats':
+                status = 200
+                self.respond(status, JSON_CONTENT_TYPE, json.dumps(service.stats.report(service.cache), indent=2))
+            elif url.path == '/sheet':
+                query = dict((name, values[-1]) for name, values in urlparse.parse_qs(url.query).items())
+                output_format, file_name, sheet, cache_hit = service.sheet(query)
+                status = 200
+                self.respond(status, CONTENT_TYPES[output_format], sheet,
+                             {"Content-Disposition": 'attachment; filename="{0}"'.format(file_name)})
+            else:
+                raise RequestError(404, "Unknown path {0}".format(url.path))
+        except RequestError as error:
+            status = error.status
+            self.respond(status, 'text/plain', str(error))
+        except Exception as error:
+            status = 500
+            service.logger.error("Request {0} failed: {1}".format(self.path, error))
+            self.respond(status, 'text/plain', "Promo sheet is not formed: {0}".format(error))
+        service.stats.record(status, time.time() - started, cache_hit)
+
+    def respond(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.service.logger.debug("{0} - {1}".format(self.client_address[0], format % args))
+
+
+class ThreadPoolHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Requests are handled by a fixed pool of threads instead of a thread per request
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, service, threads):
+        BaseHTTPServer.HTTPServer.__init__(self, address, PromoRequestHandler)
+        self.service = service
+        self.request_queue = Queue.Queue()
+        for number in xrange(max(threads, 1)):
+            worker = threading.Thread(target=self.process_queue, name='request-{0}'.format(number))
+            worker.daemon = True
+            worker.start()
+
+    def process_request(self, request, client_address):
+        self.request_queue.put((request, client_address))
+
+    def process_queue(self):
+        while True:
+            request, client_address = self.request_queue.get()
+            self.process_request_thread(request, client_address)
+
+
+class PromoService(object):
+    """
+    Local HTTP service of promo sheets.
+    Lookup data is loaded once; adjustment files and lookup data files are checked every poll_interval seconds
+    by a background thread and changed ones are loaded again as in watch mode. The new source replaces the old one
+    at once, a request renders from the source current when it starts. Rendered sheets are cached by
+    (request, input fingerprint), so a cached sheet is never served for changed input files
+    """
+
+    def __init__(self, generator, address, threads, cache_size, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.generator = generator
+        self.logger = generator.logger
+        self.poll_interval = poll_interval
+        self.watcher = PromoWatcher(generator, poll_interval, all_events=True)
+        self.cache = SheetCache(cache_size)
+        self.stats = ServiceStats()
+
+        self.source = None
+        self.lookup_version = 0
+        self._refresh_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        if generator.color_map is None:
+            generator.upload_lookup_data()
+        self.watcher.lookup_fingerprint = self.watcher.current_lookup_fingerprint()
+        self.refresh()
+        # later files are parsed in the poll thread, worker processes are not forked from a threaded server
+        self.watcher.parallel = False
+
+        self.server = ThreadPoolHTTPServer(address, self, threads)
+        self._poll_thread = threading.Thread(target=self.poll_inputs, name='input-poll')
+        self._poll_thread.daemon = True
+        self._poll_thread.start()
+
+    @property
+    def address(self):
+        """host and port the service is bound to, an ephemeral port is chosen for port 0"""
+        return self.server.server_address
+
+    def run(self):
+        self.logger.info("Promo sheet service on http://{0}:{1}/".format(*self.address))
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            self.logger.info("Promo sheet service stopped")
+        finally:
+            self.server.server_close()
+
+    def shutdown(self):
+        self._stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def poll_inputs(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as error:
+                self.logger.error("Service input is not refreshed: {0}".format(error))
+
+    def refresh(self):
+        """source of the current input files, a new one only when they are changed"""
+        with self._refresh_lock:
+            watcher = self.watcher
+            if watcher.swap_lookup_data():
+                self.lookup_version += 1
+            watcher.start_lookup_reload()
+            watcher.update_adjustments()
+
+            fingerprint = self.lookup_version, tuple(sorted(watcher.adjustment_files.items()))
+            if self.source is None or self.source.fingerprint != fingerprint:
+                adjustments = [adjustment for path in watcher.adjustment_order
+                               for adjustment in watcher.adjustments_by_file[path]]
+                self.source = SheetSource(self.generator, adjustments, fingerprint)
+                self.logger.info("Service input: {0} adjustments".format(len(adjustments)))
+            return self.source
+
+    def sheet(self, query):
+        """
+        (format, file name, rendered sheet, cache hit) of the request query
+        """
+        output_format = query.get("format", CSV_FORMAT).lower()
+        if output_format not in CONTENT_TYPES:
+            raise RequestError(400, "Unknown format {0}, csv or xls expected".format(output_format))
+        event = query.get("event")
+        start, end = self.parse_date(query, "start"), self.parse_date(query, "end")
+        if event is None and start is None and end is None:
+            raise RequestError(400, "Event or start/end dates of the sheet are expected")
+
+        source = self.source
+        key = event, start, end, output_format, source.fingerprint
+        file_name = self.file_name(output_format, event)
+
+        sheet = self.cache.get(key)
+        if sheet is not None:
+            return output_format, file_name, sheet, True
+
+        adjustments = source.select(event, start, end)
+        if not adjustments:
+            raise RequestError(404, "There are no adjustments for the request")
+        promoSheet = PromoSheet(source, adjustments, resolved_styles=source.resolved_styles)
+        sheet = promoSheet.render(output_format)
+        self.cache.put(key, sheet)
+        return output_format, file_name, sheet, False
+
+    def parse_date(self, query, name):
+        value = query.get(name)
+        if value is None:
+            return None
+        try:
+            return datetime.datetime.strptime(value, AdjustmentSchedule.INPUT_DATE_FORMAT)
+        except ValueError:
+            raise RequestError(400, "Invalid {0} date {1}, YYYY-MM-DD expected".format(name, value))
+
+    def file_name(self, output_format, event=None):
+        property_name = SHEET_FILE_PROPERTIES[output_format]
+        if event:
+            return self.generator.event_file_name(property_name, event)
+        return self.generator.configuration.get(PROPERTY_SECTION, property_name)
@@ -0,0 +1,136 @@
+"""
+Streaming writers of promo sheet: rows are written as they come, nothing is accumulated
+"""
+import csv
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+WRITE_FILE_OPTION = 'wb'
+WRITE_BUFFER_SIZE = 1 << 20
+CSV_DELIMITER = '\t'
+""" encoding of input files, values of the sheet are decoded with it; workbook is written in XML_ENCODING """
+DEFAULT_INPUT_ENCODING = 'cp1252'
+XML_ENCODING = 'utf-8'
+""" characters that are not allowed in XML 1.0 documents """
+ILLEGAL_XML_CHARACTERS = re.compile(u'[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+
+WORKBOOK_START = '''<?xml version="1.0" encoding="{encoding}"?>
+<?mso-application progid="Excel.Sheet"?>
+<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet"
+ xmlns:o="urn:schemas-microsoft-com:office:office"
+ xmlns:x="urn:schemas-microsoft-com:office:excel"
+ xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">
+ <Styles>
+  <Style ss:ID="Default" ss:Name="Normal"><Font ss:FontName="Arial" ss:Size="9"/></Style>
+  <Style ss:ID="title"><Font ss:FontName="Arial" ss:Size="12" ss:Bold="1"/></Style>
+  <Style ss:ID="band"><Alignment ss:Horizontal="Center"/><Font ss:FontName="Arial" ss:Size="9" ss:Bold="1"/>
+   <Borders><Border ss:Position="Bottom" ss:LineStyle="Continuous" ss:Weight="1"/></Borders></Style>
+  <Style ss:ID="columns"><Font ss:FontName="Arial" ss:Size="9" ss:Bold="1"/>
+   <Borders><Border ss:Position="Bottom" ss:LineStyle="Continuous" ss:Weight="1"/></Borders></Style>
+  <Style ss:ID="new"><Font ss:FontName="Arial" ss:Size="9" ss:Bold="1"/>
+   <Interior ss:Color="#C0C0C0" ss:Pattern="Solid"/></Style>
+  <Style ss:ID="footer"><Font ss:FontName="Arial" ss:Size="9" ss:Bold="1" ss:Italic="1"/></Style>
+ </Styles>
+ <Worksheet ss:Name={sheet_name}>
+  <Table>
+'''
+WORKBOOK_END = '''  </Table>
+ </Worksheet>
+</Workbook>
+'''
+SHEET_NAME_LENGTH = 31
+SHEET_NAME = 'PROMO SHEET'
+
+""" header band of Marciano template: (first column, merged columns) of every header cell """
+BAND_LAYOUT = [(1, 5), (7, 3), (11, 2), (14, 0)]
+
+
+class HighlightedRow(list):
+    """
+    Row of a new or changed promotion, bold and grey in promo sheet
+    """
+    pass
+
+
+def xml_text(value, input_encoding=DEFAULT_INPUT_ENCODING):
+    """escaped XML_ENCODING text of the cell value, byte strings are decoded with input_encoding"""
+    if not isinstance(value, unicode):
+        value = str(value).decode(input_encoding, 'replace')
+    return escape(ILLEGAL_XML_CHARACTERS.sub(u'', value)).encode(XML_ENCODING)
+
+
+def open_output(output):
+    """file of the output path, or the given file object that is left open by the writer"""
+    if isinstance(output, basestring):
+        return open(output, WRITE_FILE_OPTION, WRITE_BUFFER_SIZE), True
+    return output, False
+
+
+class CsvSheetWriter(object):
+    """
+    Promo sheet as tab delimited csv file
+    output: path of the file or a file object
+    """
+
+    def __init__(self, output):
+        self.file, self.own_file = open_output(output)
+        self.writer = csv.writer(self.file, dialect=csv.excel, delimiter=CSV_DELIMITER)
+
+    def write_header(self, title, effective_period, effective_dates, headers, columns):
+        self.writer.writerows([[title, effective_period], [effective_dates] + headers, columns])
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+
+    def write_footer(self, footer):
+        self.writer.writerow(footer)
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
+
+
+class XlsSheetWriter(object):
+    """
+    Promo sheet as Excel 2003 XML spreadsheet: the only workbook format Excel opens
+    that can be written row by row without a workbook model in memory
+    input_encoding: encoding of the values, the workbook itself is always XML_ENCODING
+    """
+
+    def __init__(self, output, sheet_name=SHEET_NAME, input_encoding=DEFAULT_INPUT_ENCODING):
+        self.file, self.own_file = open_output(output)
+        self.input_encoding = input_encoding
+        self.file.write(WORKBOOK_START.format(encoding=XML_ENCODING,
+                                              sheet_name=quoteattr(sheet_name[:SHEET_NAME_LENGTH])))
+
+    def write_cells(self, values, style=None, layout=None):
+        """layout: (first column, merged columns) of every value, values are written one after another by default"""
+        cells = []
+        for number, value in enumerate(values):
+            attributes = ''
+            if layout:
+                column, merge_across = layout[number]
+                attributes = ' ss:Index="{0}"'.format(column)
+                if merge_across:
+                    attributes += ' ss:MergeAcross="{0}"'.format(merge_across)
+            text = xml_text(value, self.input_encoding)
+            cells.append('<Cell{0}><Data ss:Type="String">{1}</Data></Cell>'.format(attributes, text))
+
+        style_attribute = ' ss:StyleID="{0}"'.format(style) if style else ''
+        self.file.write('   <Row{0}>{1}</Row>\n'.format(style_attribute, ''.join(cells)))
+
+    def write_header(self, title, effective_period, effective_dates, headers, columns):
+        self.write_cells([title, effective_period], 'title')
+        self.write_cells([effective_dates] + headers, 'band', BAND_LAYOUT)
+        self.write_cells(columns, 'columns')
+
+    def write_row(self, row):
+        self.write_cells(row, 'new' if isinstance(row, HighlightedRow) else None)
+
+    def write_footer(self, footer):
+        self.write_cells(footer, 'footer')
+
+    def close(self):
+        self.file.write(WORKBOOK_END)
+        if self.own_file:
+            self.file.close()
@@ -0,0 +1,186 @@
+"""
+Watch mode: promo sheets are regenerated as adjustment files arrive, lookup data stays in memory
+"""
+import glob
+import os
+import threading
+import time
+
+PROPERTY_SECTION = 'PROMO_SHEET'
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+class PromoWatcher(object):
+    """
+    Polls input directory of the generator.
+    New, changed and removed adjustment files are parsed again and only sheets of their events are rewritten;
+    changed item information or other data files are reloaded in a background thread and swapped in
+    between two regenerations
+    all_events: adjustments of all events are kept whatever the mode of the generator is
+    parallel: files may be parsed by parallel workers of the generator
+    """
+
+    def __init__(self, generator, poll_interval, all_events=False):
+        self.generator = generator
+        self.logger = generator.logger
+        self.poll_interval = poll_interval
+
+        configuration = generator.configuration
+        self.adjustments_pattern = os.path.join(generator.input_dir,
+                                                configuration.get(PROPERTY_SECTION, "adjustments_files"))
+        self.event = None if generator.batch_mode or all_events else configuration.get(PROPERTY_SECTION, "event_name")
+        self.parallel = True
+
+        self.adjustment_files = {}
+        self.adjustment_order = []
+        self.adjustments_by_file = {}
+        self.first_scan = True
+
+        self.lookup_fingerprint = None
+        self._reload_thread = None
+        self._reloaded_lookup = None
+        self._reload_lock = threading.Lock()
+
+    def run(self):
+        self.logger.info("Watching {0} every {1} seconds".format(self.adjustments_pattern, self.poll_interval))
+        if self.generator.color_map is None:
+            self.generator.upload_lookup_data()
+        self.lookup_fingerprint = self.current_lookup_fingerprint()
+        try:
+            while True:
+                self.poll()
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            self.logger.info("Watching stopped")
+
+    def poll(self):
+        lookup_swapped = self.swap_lookup_data()
+        self.start_lookup_reload()
+
+        affected_events = self.update_adjustments()
+        if lookup_swapped:
+            affected_events = None
+
+        if affected_events is None or affected_events:
+            try:
+                self.regenerate(affected_events)
+            except Exception as error:
+                self.logger.error("Promo sheet is not regenerated: {0}".format(error))
+
+    def current_lookup_fingerprint(self):
+        generator = self.generator
+        item_info_files = glob.glob(os.path.join(generator.input_dir, generator.item_info_template))
+        paths = [generator.other_data_file, generator.merchandising_file]
+        if item_info_files:
+            paths.append(max(item_info_files, key=os.path.getctime))
+        return [(path, file_fingerprint(path)) for path in paths if os.path.isfile(path)]
+
+    def start_lookup_reload(self):
+        """background reload of lookup data when its files are changed"""
+        if self._reload_thread and self._reload_thread.is_alive():
+            return None
+
+        fingerprint = self.current_lookup_fingerprint()
+        if fingerprint == self.lookup_fingerprint:
+            return None
+
+        self.logger.info("Lookup data files are changed, reloading")
+        self.lookup_fingerprint = fingerprint
+        self._reload_thread = threading.Thread(target=self.reload_lookup_data, name='lookup-reload')
+        self._reload_thread.daemon = True
+        self._reload_thread.start()
+
+    def reload_lookup_data(self):
+        try:
+            lookup_data = self.generator.load_lookup_data()
+        except Exception as error:
+            self.logger.error("Lookup data is not reloaded: {0}".format(error))
+            return None
+        with self._reload_lock:
+            self._reloaded_lookup = lookup_data
+
+    def swap_lookup_data(self):
+        """reloaded other data, merchandising signage and color map replace the used ones all together"""
+        with self._reload_lock:
+            lookup_data, self._reloaded_lookup = self._reloaded_lookup, None
+        if lookup_data is None:
+            return False
+
+        generator = self.generator
+        generator.other_data, generator.marchandising_signage, generator.color_map = lookup_data
+        generator.resolved_styles.clear()
+        generator.missing_styles.clear()
+        self.logger.info("Reloaded lookup data is in use")
+        return True
+
+    def update_adjustments(self):
+        """parse new and changed adjustment files, forget removed ones; events of their adjustments are returned"""
+        generator = self.generator
+        adjustment_order = glob.glob(self.adjustments_pattern)
+        current_files = dict((path, file_fingerprint(path)) for path in adjustment_order)
+        changed_files = [path for path in adjustment_order if self.adjustment_files.get(path) != current_files[path]]
+
+        try:
+            parsed_adjustments = list(generator.parse_adjustment_files(changed_files, self.event,
+                                                                       parallel=self.parallel))
+        except Exception as error:
+            self.logger.error("Adjustment files are not loaded: {0}".format(error))
+            parsed_adjustments = list(self.parse_files_one_by_one(changed_files))
+
+        affected_events = set()
+        for path in set(self.adjustment_files) - set(current_files):
+            self.logger.info("Adjustment file removed: {0}".format(path))
+            affected_events.update(adjustment.event for adjustment in self.adjustments_by_file.pop(path, []))
+
+        for path, adjustments in zip(changed_files, parsed_adjustments):
+            self.logger.info("Adjustment file loaded: {0}, {1} adjustments".format(path, len(adjustments)))
+            affected_events.update(adjustment.event for adjustment in self.adjustments_by_file.get(path, []))
+            affected_events.update(adjustment.event for adjustment in adjustments)
+            generator.count_parsed_lines(adjustments)
+            if not self.first_scan:
+                generator.new_adjustments.update(adjustment.oid for adjustment in adjustments)
+            self.adjustments_by_file[path] = adjustments
+
+        self.adjustment_files = current_files
+        self.adjustment_order = adjustment_order
+        if self.first_scan:
+            self.first_scan = False
+            return None
+        return affected_events
+
+    def parse_files_one_by_one(self, paths):
+        """
+        Adjustments of every file parsed alone, a file that can not be parsed has none.
+        Such file is skipped until it is changed again: a file that is still written is parsed when it is complete
+        """
+        for path in paths:
+            try:
+                adjustments, = self.generator.parse_adjustment_files([path], self.event, parallel=False)
+            except Exception as error:
+                self.logger.error("Adjustment file is skipped until it is changed: {0}, {1}".format(path, error))
+                adjustments = []
+            yield adjustments
+
+    def regenerate(self, events=None):
+        """sheets of the events, all sheets when events is None"""
+        generator = self.generator
+        generator.adjustments = [adjustment for path in self.adjustment_order
+                                 for adjustment in self.adjustments_by_file[path]]
+        generator.report_overlaps()
+
+        if not generator.batch_mode:
+            generator.form_promo_sheet()
+            return None
+
+        if generator.partitioned_export:
+            generator.form_partition_promo_sheets(events)
+            return None
+
+        generator.form_event_promo_sheets(events)
+        for event in (events or []):
+            if event not in generator.events:
+                self.logger.warning("There are no adjustments of event {0} anymore".format(event))
@@ -0,0 +1,58 @@
+"""
+Adjustment line parsing micro-benchmark: exec based dispatch vs dispatch table
+
+Usage: python -m benchmarks.adjustment_parsing [<item lines>]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from app.adjustment import Adjustment
+from app.promo_sheet import PromoSheet
+from benchmarks.synthetic import write_adjustment
+
+DEFAULT_ITEM_LINES = 100000
+REPEAT = 3
+
+
+class ExecAdjustment(Adjustment):
+    """adjustment parser as it was before the dispatch table: source string compiled per line"""
+
+    def process_line(self, line):
+        fields = line.split("|")
+        field_type = fields[0]
+        type = self.DATA_TYPES.get(field_type)
+        if type:
+            exec "self.%s(%s)" % (type, fields[1:])
+        else:
+            raise Exception("Invalid data type on line: %s" % line)
+
+
+def lines_per_second(adjustment_class, lines):
+    best = min(timeit.repeat(lambda: adjustment_class(lines), number=1, repeat=REPEAT))
+    return len(lines) / best
+
+
+def main(item_lines):
+    work_dir = tempfile.mkdtemp()
+    try:
+        path = write_adjustment(os.path.join(work_dir, 'adjustment_bench.txt'), 'BENCH', items=item_lines)
+        with open(path) as adjustment_file:
+            lines = adjustment_file.readlines()
+    finally:
+        shutil.rmtree(work_dir)
+
+    before = lines_per_second(ExecAdjustment, lines)
+    after = lines_per_second(Adjustment, lines)
+    projected = lines_per_second(lambda data: Adjustment(data, item_fields=PromoSheet.ITEM_PRICE_FIELDS), lines)
+    print "lines: {0}".format(len(lines))
+    print "exec dispatch:  {0:12.0f} lines/sec".format(before)
+    print "table dispatch: {0:12.0f} lines/sec".format(after)
+    print "projected:      {0:12.0f} lines/sec".format(projected)
+    print "speedup: {0:.1f}x".format(after / before)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITEM_LINES)
@@ -0,0 +1,76 @@
+"""
+ColorMap build memory benchmark: list/namedtuple based build vs streaming compact build.
+Every build runs in its own process and reports its peak RSS.
+
+Usage: python -m benchmarks.color_map_memory [<item rows>]
+"""
+import collections
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.color_map import ColorMap
+from benchmarks.synthetic import write_item_info
+
+DEFAULT_ITEM_ROWS = 5000000
+LEGACY, COMPACT = 'legacy', 'compact'
+
+
+def build_legacy(item_info_name):
+    """color map as it was built before streaming: whole file split into a list, namedtuple per row"""
+    color_map = collections.defaultdict(dict)
+    ItemInfo = collections.namedtuple('ItemInfo',
+                                      ['variant_code', 'description', 'a', 'style_code', 'c', 'd', 'e', 'f',
+                                       'color', 'size', 'g', 'filter_code', 'h'])
+    with open(item_info_name) as item_info_file:
+        lines = [line.split('|') for line in item_info_file]
+        for item in map(ItemInfo._make, lines):
+            if item.filter_code != '0':
+                continue
+            color_map[item.style_code][item.variant_code] = (item.color, item.description)
+    return color_map
+
+
+def build_compact(item_info_name):
+    path, filename = os.path.split(item_info_name)
+    return ColorMap(logging.getLogger('benchmark'), path, filename)
+
+
+def measure(kind, item_info_name):
+    """child process: build one color map and print seconds and peak RSS in KB"""
+    started = time.time()
+    color_map = (build_legacy if kind == LEGACY else build_compact)(item_info_name)
+    elapsed = time.time() - started
+    print elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, len(color_map.keys())
+
+
+def run(kind, item_info_name):
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.color_map_memory', '--measure',
+                                      kind, item_info_name])
+    elapsed, peak_rss, styles = output.split()
+    return float(elapsed), int(peak_rss), int(styles)
+
+
+def main(item_rows):
+    work_dir = tempfile.mkdtemp()
+    try:
+        item_info_name = write_item_info(os.path.join(work_dir, 'JDA_Item_bench.txt'), item_rows)
+        print "item rows: {0}, file size: {1} MB".format(item_rows, os.path.getsize(item_info_name) >> 20)
+        for kind in (LEGACY, COMPACT):
+            elapsed, peak_rss, styles = run(kind, item_info_name)
+            print "{0:8} build: {1:7.2f} s, peak RSS: {2:7d} MB, styles: {3}".format(kind, elapsed,
+                                                                                    peak_rss >> 10, styles)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--measure':
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITEM_ROWS)
@@ -0,0 +1,95 @@
+"""
+PromoSheet.form_records scaling benchmark: list membership without memo vs indexed styles with memo.
+The number of adjustments and styles grow together, every adjustment references styles of the whole range.
+
+Usage: python -m benchmarks.form_records_scaling [<items per adjustment>]
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from app.adjustment import read_adjustments
+from app.color_map import ColorMap
+from app.promo_sheet import PromoSheet, EMPTY_OTHER_INFO_ROW_PART
+from benchmarks.synthetic import adjustment_lines, write_item_info
+
+SCALES = [(25, 250), (50, 500), (100, 1000), (200, 2000), (400, 4000)]
+DEFAULT_ITEMS_PER_ADJUSTMENT = 200
+VARIANTS_PER_STYLE = 4
+
+
+class BenchmarkGenerator(object):
+    """the part of PromoGenerator used by PromoSheet.form_records"""
+
+    def __init__(self, adjustments, color_map):
+        self.adjustments = adjustments
+        self.color_map = color_map
+        self.other_data = {}
+        self.marchandising_signage = {}
+        self.new_adjustments = set()
+        self.logger = logging.getLogger('benchmark')
+
+
+def legacy_form_records(generator):
+    """rows formed as before style memo: list of styles scanned and colors resolved per adjustment"""
+    color_map, other_info, marchandising_signage = \
+        generator.color_map, generator.other_data, generator.marchandising_signage
+    result = []
+    for adjustment in generator.adjustments:
+        adjustment_item_styles = set(item_price.item_style_code for item_price in adjustment.item_price)
+        possible_styles = color_map.keys()
+        current_adjustment_styles = \
+            {style: (['ALL', color_map.get_colors(style).values()[0][1]]
+                     if len(color_map.get_colors(style).values()) >= 2 else
+                     list(color_map.get_colors(style).values()[0]))
+             for style in adjustment_item_styles
+             if style in possible_styles}
+        result.extend([[adjustment.parameters['PromoCategory'].value, adjustment.header_description, style]
+                       + current_adjustment_styles[style]
+                       + marchandising_signage.get(adjustment.oid, [''])
+                       + other_info.get(style, EMPTY_OTHER_INFO_ROW_PART)[1:]
+                       for style in adjustment_item_styles
+                       if style in possible_styles])
+    return result
+
+
+def indexed_form_records(generator):
+    promo_sheet = PromoSheet(generator)
+    promo_sheet.form_records()
+    return promo_sheet.records
+
+
+def seconds(form_records, generator):
+    started = time.time()
+    rows = form_records(generator)
+    return time.time() - started, len(rows)
+
+
+def main(items):
+    logging.getLogger('benchmark').setLevel(logging.ERROR)
+    work_dir = tempfile.mkdtemp()
+    try:
+        print "{0:>12} {1:>8} {2:>8} {3:>12} {4:>12}".format('adjustments', 'styles', 'rows', 'legacy, s',
+                                                              'indexed, s')
+        for adjustments_count, styles in SCALES:
+            write_item_info(os.path.join(work_dir, 'JDA_Item_bench.txt'), styles * VARIANTS_PER_STYLE,
+                            VARIANTS_PER_STYLE)
+            color_map = ColorMap(logging.getLogger('benchmark'), work_dir, 'JDA_Item_bench.txt')
+            lines = []
+            for number in xrange(adjustments_count):
+                lines.extend(adjustment_lines('OID{0}'.format(number), 'BENCH', items, styles))
+            generator = BenchmarkGenerator(list(read_adjustments(lines)), color_map)
+
+            legacy, rows = seconds(legacy_form_records, generator)
+            indexed, _ = seconds(indexed_form_records, generator)
+            print "{0:12d} {1:8d} {2:8d} {3:12.3f} {4:12.3f}".format(adjustments_count, styles, rows, legacy,
+                                                                     indexed)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITEMS_PER_ADJUSTMENT)
@@ -0,0 +1,70 @@
+"""
+Per-style price range benchmark: item price objects vs item price columns.
+Parsing is measured for both representations, aggregation is group-by of min/max price by style
+over ItemPrice objects in a dict vs ItemPriceColumns array buffers
+
+Usage: python -m benchmarks.price_analytics [<item lines>] [<styles>]
+"""
+import random
+import sys
+import time
+
+from app.adjustment import Adjustment
+from app.item_price_columns import parse_price
+from benchmarks.synthetic import adjustment_lines
+
+DEFAULT_ITEM_LINES = 200000
+DEFAULT_STYLES = 5000
+REPEAT = 3
+
+
+def object_price_ranges(adjustment):
+    """(min price, max price) by style over ItemPrice objects, as it is done without columns"""
+    ranges = {}
+    for item_price in adjustment.item_price:
+        price = parse_price(item_price.item_price)
+        if price != price:
+            continue
+        price_range = ranges.get(item_price.item_style_code)
+        if price_range is None:
+            ranges[item_price.item_style_code] = (price, price)
+        else:
+            ranges[item_price.item_style_code] = (min(price_range[0], price), max(price_range[1], price))
+    return ranges
+
+
+def column_price_ranges(adjustment):
+    columns = adjustment.item_columns
+    return dict(zip(columns.styles, columns.price_ranges()))
+
+
+def best_seconds(function, *arguments):
+    best, result = None, None
+    for _ in xrange(REPEAT):
+        started = time.time()
+        result = function(*arguments)
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(item_lines, styles):
+    lines = list(adjustment_lines('BENCH', 'BENCH', item_lines, styles, random.Random(0)))
+
+    object_parse, object_adjustment = best_seconds(Adjustment, lines)
+    column_parse, column_adjustment = best_seconds(lambda data: Adjustment(data, item_columns=True), lines)
+    object_aggregate, object_ranges = best_seconds(object_price_ranges, object_adjustment)
+    column_aggregate, column_ranges = best_seconds(column_price_ranges, column_adjustment)
+    if object_ranges != column_ranges:
+        raise Exception("Price ranges of objects and columns are different")
+
+    print "item lines: {0}, styles: {1}".format(item_lines, len(column_ranges))
+    print "{0:>10} {1:>12} {2:>14}".format('', 'parse, s', 'aggregate, s')
+    print "{0:>10} {1:12.3f} {2:14.3f}".format('objects', object_parse, object_aggregate)
+    print "{0:>10} {1:12.3f} {2:14.3f}".format('columns', column_parse, column_aggregate)
+    print "aggregate speedup: {0:.1f}x".format(object_aggregate / column_aggregate)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITEM_LINES,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_STYLES)
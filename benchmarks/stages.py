@@ -0,0 +1,99 @@
+"""
+Stage by stage benchmark of promo sheet generation on a synthetic dataset.
+Every stage is timed and memory profiled separately, results are written as JSON
+
+Usage: python -m benchmarks.stages [options], see --help
+"""
+import argparse
+import datetime
+import json
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+from app.metrics import current_rss_kb
+from app.promo_sheet import PromoSheet
+from app.promo_sheet_generator import PromoGenerator
+from benchmarks.synthetic import dataset_arguments, dataset_options, write_dataset
+
+DEFAULT_RESULTS_FILE = 'bench_results.json'
+
+
+class StageTimer(object):
+    """
+    Wall time, CPU time, resident memory growth and peak RSS of named stages
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, function, *arguments):
+        rss_before = current_rss_kb()
+        cpu_before = time.clock()
+        started = time.time()
+        result = function(*arguments)
+        self.stages.append({
+            'stage': name,
+            'wall_seconds': round(time.time() - started, 6),
+            'cpu_seconds': round(time.clock() - cpu_before, 6),
+            'rss_growth_kb': current_rss_kb() - rss_before,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        })
+        return result
+
+
+def run_stages(property_file):
+    timer = StageTimer()
+
+    generator = timer.run('configuration', PromoGenerator, property_file, False)
+    timer.run('color_map', generator.upload_color_map)
+
+    def upload_other_data():
+        generator.other_data = generator.upload_other_data(generator.other_data_file)
+        generator.marchandising_signage = generator.upload_other_data(generator.merchandising_file)
+    timer.run('upload_other_data', upload_other_data)
+
+    timer.run('upload_adjustments', generator.upload_adjustments)
+
+    promo_sheet = PromoSheet(generator)
+    timer.run('form_records', promo_sheet.form_records)
+    timer.run('export_csv', promo_sheet.export_csv)
+    return timer.stages, len(generator.adjustments), len(promo_sheet.records)
+
+
+def main():
+    parser = dataset_arguments(argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]))
+    parser.add_argument('--output', default=DEFAULT_RESULTS_FILE, help='JSON results file')
+    parser.add_argument('--keep', help='directory for the dataset, kept after the run')
+    arguments = parser.parse_args()
+
+    work_dir = arguments.keep or tempfile.mkdtemp()
+    try:
+        property_file = write_dataset(work_dir, **dataset_options(arguments))
+        stages, adjustments, rows = run_stages(property_file)
+    finally:
+        if not arguments.keep:
+            shutil.rmtree(work_dir)
+
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset': dataset_options(arguments),
+        'adjustments_loaded': adjustments,
+        'rows': rows,
+        'stages': stages,
+    }
+    with open(arguments.output, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+    for stage in stages:
+        print "{stage:20} {wall_seconds:10.3f} s {cpu_seconds:10.3f} cpu s {rss_growth_kb:10d} KB " \
+              "{peak_rss_kb:10d} KB peak".format(**stage)
+    print "results: {0}".format(arguments.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Synthetic input files for benchmarks: adjustments with every line type, JDA item information,
+other item information and merchandising signage of matching styles and OIDs
+
+Usage: python -m benchmarks.synthetic <directory> [options], see --help
+"""
+import argparse
+import os
+import random
+
+OUTPUT_DELIMITER = '|'
+WRITE_FILE_OPTION = 'w'
+
+ADJUSTMENT_FILE_NAME = 'adjustment_{0:05d}.txt'
+ITEM_INFO_FILE_NAME = 'JDA_Item_info.txt'
+OTHER_INFO_FILE_NAME = 'other_item_info.txt'
+MERCHANDISING_FILE_NAME = 'marchandising_signage.txt'
+PROPERTY_FILE_NAME = 'Guess.properties'
+DEFAULT_EVENT = 'TEST PROMO'
+
+ADJUSTMENT_HEADER_LINES = [
+    ['D', 'Pen', 'Synthetic promo', ''],
+    ['S', '2016-06-01', '2016-06-30', '', '', '1', '1', '1', '1', '1', '1', '1'],
+    ['U', 'H', 'I', '', 'All'],
+    ['C', 'H', 'I', '', 'All', ''],
+    ['L', 'H', 'I', 'LUSA-100', '100', ''],
+    ['P', 'H', 'I', 'P6-715-820', '820 WM Sandals', '', ''],
+    ['P', 'H', 'I', 'P6-725-870', '870 MN Sandals', '', ''],
+    ['V', 'PromotionPct', '-10', ''],
+    ['V', 'PriceType', 'REG', ''],
+    ['V', 'EventType', 'A', ''],
+    ['V', 'Country', 'USA', ''],
+    ['V', 'PromoName', 'Synthetic promo name', ''],
+    ['V', 'PromoCategory', 'Synthetic promo category', ''],
+    ['CB', 'C100'],
+    ['LB', '100', 'Z1', 'B1'],
+    ['LB', '200', 'Z1', 'B1'],
+]
+
+PROPERTIES = '''[PROMO_SHEET]
+
+event_name = {event}
+
+input_dir = {input_dir}
+output_dir = {output_dir}
+
+log_level = WARNING
+log_file = promo_generation.log
+
+adjustments_files = adjustment*.txt
+item_info = JDA_Item*.txt
+
+other_info = {other_info}
+marchandising_info = {merchandising_info}
+
+output_csv_file = promo.csv
+promo_sheet = promo.xls
+'''
+
+
+def style_code(number):
+    return 'S{0:07d}'.format(number)
+
+
+def oid(number):
+    return 'OID{0:029d}'.format(number)
+
+
+def event_name(number, events):
+    return DEFAULT_EVENT if events <= 1 else '{0} {1}'.format(DEFAULT_EVENT, number % events)
+
+
+def adjustment_lines(oid, event, items, styles, rnd=random):
+    """lines of one adjustment with `items` item price lines over `styles` style codes"""
+    yield OUTPUT_DELIMITER.join(['A', oid, oid, 'Synthetic {0}'.format(oid), event, 'Promotion %'])
+    for fields in ADJUSTMENT_HEADER_LINES:
+        yield OUTPUT_DELIMITER.join(fields)
+    for _ in xrange(items):
+        style = style_code(rnd.randrange(styles))
+        yield OUTPUT_DELIMITER.join(['I', '', '', '', '', '', 'LUSA-100', '100', '', '2016-06-01', '2016-06-30',
+                                     '1', style, '', '', '{0:.2f}'.format(rnd.uniform(10, 200)), 'USD'])
+
+
+def write_lines(path, lines):
+    with open(path, WRITE_FILE_OPTION) as output_file:
+        for line in lines:
+            output_file.write(line + '\n')
+    return path
+
+
+def write_adjustment(path, oid, event=DEFAULT_EVENT, items=1000, styles=100, seed=0):
+    return write_lines(path, adjustment_lines(oid, event, items, styles, random.Random(seed)))
+
+
+def item_info_lines(rows, variants_per_style=8, colors=200, excluded_share=0.05, rnd=random):
+    """JDA item information lines: variants of one style are consecutive, colors repeat across styles"""
+    for row in xrange(rows):
+        style = style_code(row // variants_per_style)
+        filter_code = '8' if rnd.random() < excluded_share else '0'
+        yield OUTPUT_DELIMITER.join([str(100000 + row), 'DESCR {0}'.format(style), 'A', style, '3', '10', '115',
+                                     '115', 'CL{0}'.format(rnd.randint(1, colors)), str(rnd.randint(24, 40)), '',
+                                     filter_code, ''])
+
+
+def write_item_info(path, rows, variants_per_style=8, seed=0):
+    return write_lines(path, item_info_lines(rows, variants_per_style, rnd=random.Random(seed)))
+
+
+def other_info_lines(styles):
+    for number in xrange(styles):
+        yield OUTPUT_DELIMITER.join([style_code(number), 'Apparel', '', '', '', 'Yes', '', '', '', 'some note'])
+
+
+def merchandising_lines(adjustments):
+    for number in xrange(adjustments):
+        yield OUTPUT_DELIMITER.join([oid(number), 'Signage for {0}'.format(oid(number))])
+
+
+def write_dataset(directory, adjustments=100, items=1000, styles=1000, variants_per_style=8, events=1,
+                  adjustments_per_file=1, seed=0):
+    """
+    Complete input directory with a property file; every style of adjustments is in item information
+    and other item information, every adjustment has merchandising signage
+    """
+    rnd = random.Random(seed)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    for file_number, first in enumerate(xrange(0, adjustments, adjustments_per_file)):
+        lines = []
+        for number in xrange(first, min(first + adjustments_per_file, adjustments)):
+            lines.extend(adjustment_lines(oid(number), event_name(number, events), items, styles, rnd))
+        write_lines(os.path.join(directory, ADJUSTMENT_FILE_NAME.format(file_number)), lines)
+
+    write_lines(os.path.join(directory, ITEM_INFO_FILE_NAME),
+                item_info_lines(styles * variants_per_style, variants_per_style, rnd=rnd))
+    write_lines(os.path.join(directory, OTHER_INFO_FILE_NAME), other_info_lines(styles))
+    write_lines(os.path.join(directory, MERCHANDISING_FILE_NAME), merchandising_lines(adjustments))
+    return write_properties(directory, directory, events=events)
+
+
+def write_properties(input_dir, output_dir, path=None, events=1, **options):
+    """
+    property file of the dataset, options are appended as additional properties;
+    adjustments of several events are all loaded in batch mode, event_name matches only one of them
+    """
+    path = path or os.path.join(input_dir, PROPERTY_FILE_NAME)
+    if events > 1:
+        options.setdefault('batch_mode', 'true')
+    with open(path, WRITE_FILE_OPTION) as property_file:
+        property_file.write(PROPERTIES.format(event=DEFAULT_EVENT, input_dir=input_dir, output_dir=output_dir,
+                                              other_info=OTHER_INFO_FILE_NAME,
+                                              merchandising_info=MERCHANDISING_FILE_NAME))
+        for name, value in sorted(options.items()):
+            property_file.write('{0} = {1}\n'.format(name, value))
+    return path
+
+
+def dataset_arguments(parser):
+    parser.add_argument('--adjustments', type=int, default=100, help='number of adjustments')
+    parser.add_argument('--items', type=int, default=1000, help='item price lines per adjustment')
+    parser.add_argument('--styles', type=int, default=1000, help='number of style codes')
+    parser.add_argument('--variants', type=int, default=8, help='item information rows per style')
+    parser.add_argument('--events', type=int, default=1, help='number of events')
+    parser.add_argument('--adjustments-per-file', type=int, default=1, help='adjustments in one file')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+
+def dataset_options(arguments):
+    return dict(adjustments=arguments.adjustments, items=arguments.items, styles=arguments.styles,
+                variants_per_style=arguments.variants, events=arguments.events,
+                adjustments_per_file=arguments.adjustments_per_file, seed=arguments.seed)
+
+
+if __name__ == '__main__':
+    parser = dataset_arguments(argparse.ArgumentParser(description='Write synthetic promo sheet input files'))
+    parser.add_argument('directory')
+    arguments = parser.parse_args()
+    print write_dataset(arguments.directory, **dataset_options(arguments))
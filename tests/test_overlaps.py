@@ -0,0 +1,113 @@
+"""
+Sorted sweep of find_overlaps gives the conflicts of a brute force pairwise check,
+with item prices parsed fully, in projection mode and in columns
+
+Usage: python -m unittest tests.test_overlaps
+"""
+import datetime
+import random
+import unittest
+
+from app.adjustment import Adjustment
+from app.overlaps import ITEM_PRICE_FIELDS, find_overlaps
+from app.promo_sheet import PromoSheet
+
+STYLES = ['S{0}'.format(number) for number in xrange(6)]
+FIRST_DAY = datetime.date(2016, 8, 1)
+
+
+def date_text(day, padded):
+    date = FIRST_DAY + datetime.timedelta(days=day)
+    return date.isoformat() if padded else '{0}-{1}-{2}'.format(date.year, date.month, date.day)
+
+
+def random_period(rnd):
+    """(start, end) text of a period in August - October 2016, dates are zero-padded or not"""
+    start = rnd.randrange(90)
+    return date_text(start, rnd.random() < 0.5), date_text(start + rnd.randrange(20), rnd.random() < 0.5)
+
+
+def adjustment_lines(oid, rnd):
+    """adjustment with a schedule and item price lines with own, empty or invalid dates"""
+    schedule_start, schedule_end = random_period(rnd)
+    yield 'A|{0}|{0}|Promotion {0}|TEST PROMO|Promotion %'.format(oid)
+    yield 'S|{0}|{1}|||1|1|1|1|1|1|1'.format(schedule_start, schedule_end)
+    for _ in xrange(rnd.randrange(1, 4)):
+        kind = rnd.random()
+        if kind < 0.6:
+            start, end = random_period(rnd)
+        elif kind < 0.9:
+            start, end = '', ''
+        else:
+            start, end = 'not a date', ''
+        yield 'I||||||LUSA-100|100||{0}|{1}|1|{2}|||10.00|USD'.format(start, end, rnd.choice(STYLES))
+
+
+def parse_date(text):
+    try:
+        return datetime.datetime.strptime(text, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def brute_force_overlaps(adjustments_lines):
+    """(style, start, end, OIDs) of every group of pairwise connected overlapping intervals of two or more OIDs"""
+    intervals = []
+    for lines in adjustments_lines:
+        oid = lines[0].split('|')[1]
+        schedule = lines[1].split('|')
+        for line in lines[2:]:
+            fields = line.split('|')
+            start = parse_date(fields[9]) or parse_date(schedule[1])
+            end = parse_date(fields[10]) or parse_date(schedule[2])
+            intervals.append((fields[12], start, end, oid))
+
+    groups = range(len(intervals))
+
+    def root(number):
+        while groups[number] != number:
+            number = groups[number]
+        return number
+
+    for first, (style, start, end, _) in enumerate(intervals):
+        for second, (other_style, other_start, other_end, _) in enumerate(intervals):
+            if style == other_style and start <= other_end and other_start <= end:
+                groups[root(first)] = root(second)
+
+    members = {}
+    for number, interval in enumerate(intervals):
+        members.setdefault(root(number), []).append(interval)
+    conflicts = set()
+    for group in members.values():
+        oids = tuple(sorted(set(interval[3] for interval in group)))
+        if len(oids) > 1:
+            conflicts.add((group[0][0], min(interval[1] for interval in group),
+                           max(interval[2] for interval in group), oids))
+    return conflicts
+
+
+class FindOverlapsTest(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(7)
+        self.adjustments_lines = [list(adjustment_lines('OID{0:03d}'.format(number), rnd)) for number in xrange(60)]
+        self.expected = brute_force_overlaps(self.adjustments_lines)
+
+    def conflicts(self, **parsing):
+        adjustments = [Adjustment(lines, **parsing) for lines in self.adjustments_lines]
+        return set((style, start, end, tuple(sorted(adjustment.oid for adjustment in conflict_adjustments)))
+                   for style, start, end, conflict_adjustments in find_overlaps(adjustments))
+
+    def test_item_prices(self):
+        self.assertTrue(len(self.expected) > 5)
+        self.assertEqual(self.conflicts(), self.expected)
+
+    def test_projected_item_prices(self):
+        self.assertEqual(self.conflicts(item_fields=PromoSheet.ITEM_PRICE_FIELDS + ITEM_PRICE_FIELDS), self.expected)
+
+    def test_item_price_columns(self):
+        self.assertEqual(self.conflicts(item_columns=True), self.expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
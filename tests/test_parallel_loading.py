@@ -0,0 +1,45 @@
+"""
+Parallel loading of adjustment files gives the same promo sheet as serial loading
+
+Usage: python -m unittest tests.test_parallel_loading
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.promo_sheet_generator import PromoGenerator
+from benchmarks.synthetic import write_dataset, write_properties
+
+
+class ParallelLoadingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.work_dir, 'input')
+        write_dataset(self.input_dir, adjustments=40, items=50, styles=200, seed=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def promo_csv(self, name, **options):
+        """promo CSV bytes of a run with the options"""
+        output_dir = os.path.join(self.work_dir, name)
+        os.makedirs(output_dir)
+        property_file = write_properties(self.input_dir, output_dir, os.path.join(self.work_dir, name + '.properties'),
+                                         **options)
+        generator = PromoGenerator(property_file)
+        generator.upload_adjustments()
+        generator.form_promo_sheet()
+        with open(os.path.join(output_dir, 'promo.csv'), 'rb') as csv_file:
+            return csv_file.read()
+
+    def test_parallel_csv_is_byte_identical_to_serial(self):
+        serial = self.promo_csv('serial', parallel_workers=0)
+        parallel = self.promo_csv('parallel', parallel_workers=4, parallel_chunk_size=3)
+        self.assertTrue(serial.count('\n') > 40)
+        self.assertEqual(serial, parallel)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Service mode on localhost: sheets, cache, errors and stats of a service on an ephemeral port
+
+Usage: python -m unittest tests.test_service
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib
+import urllib2
+
+from app.promo_sheet_generator import PromoGenerator
+from app.service import PromoService
+from benchmarks.synthetic import DEFAULT_EVENT, write_dataset, write_properties
+
+
+class PromoServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        input_dir = os.path.join(self.work_dir, 'input')
+        write_dataset(input_dir, adjustments=10, items=30, styles=50, seed=5)
+
+        """ promo CSV of a regular run is the expected sheet """
+        output_dir = os.path.join(self.work_dir, 'output')
+        os.makedirs(output_dir)
+        property_file = write_properties(input_dir, output_dir, os.path.join(self.work_dir, 'test.properties'))
+        generator = PromoGenerator(property_file)
+        generator.upload_adjustments()
+        generator.form_promo_sheet()
+        with open(os.path.join(output_dir, 'promo.csv'), 'rb') as csv_file:
+            self.expected_csv = csv_file.read()
+
+        self.service = PromoService(PromoGenerator(property_file), ('127.0.0.1', 0), 2, 4, poll_interval=60)
+        self.thread = threading.Thread(target=self.service.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.service.shutdown()
+        self.thread.join(5)
+        shutil.rmtree(self.work_dir)
+
+    def get(self, path, **query):
+        """(status, content type, body) of the response"""
+        url = 'http://{0}:{1}{2}'.format(self.service.address[0], self.service.address[1], path)
+        if query:
+            url += '?' + urllib.urlencode(query)
+        try:
+            response = urllib2.urlopen(url)
+        except urllib2.HTTPError as error:
+            return error.code, error.info().gettype(), error.read()
+        return response.getcode(), response.info().gettype(), response.read()
+
+    def test_sheet_cache_errors_and_stats(self):
+        status, content_type, body = self.get('/sheet', event=DEFAULT_EVENT, format='csv')
+        self.assertEqual((status, content_type), (200, 'text/tab-separated-values'))
+        self.assertEqual(body, self.expected_csv)
+
+        self.assertEqual(self.get('/sheet', event=DEFAULT_EVENT, format='csv')[2], self.expected_csv)
+
+        status, content_type, body = self.get('/sheet', event=DEFAULT_EVENT, format='xls')
+        self.assertEqual((status, content_type), (200, 'application/vnd.ms-excel'))
+        self.assertTrue(body.startswith('<?xml version="1.0" encoding="utf-8"?>'))
+
+        self.assertEqual(self.get('/sheet', start='2016-13-01')[0], 400)
+        self.assertEqual(self.get('/sheet', event='UNKNOWN EVENT')[0], 404)
+
+        status, content_type, body = self.get('/stats')
+        self.assertEqual((status, content_type), (200, 'application/json'))
+        stats = json.loads(body)
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['statuses'], {'200': 3, '400': 1, '404': 1})
+        self.assertEqual((stats['cache']['hits'], stats['cache']['misses']), (1, 2))
+        self.assertEqual(stats['cache']['hit_rate'], round(1 / 3.0, 4))
+        latency = stats['latency_ms']
+        self.assertEqual(latency['samples'], 5)
+        for percentile in ('p50', 'p90', 'p99', 'max'):
+            self.assertTrue(latency[percentile] >= 0)
+        self.assertTrue(latency['p50'] <= latency['p90'] <= latency['p99'] <= latency['max'])
+
+
+if __name__ == '__main__':
+    unittest.main()